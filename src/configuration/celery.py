@@ -2,7 +2,8 @@ from __future__ import absolute_import, unicode_literals
 
 import os
 
-from celery import Celery
+from celery import Celery, signals
+from django.conf import settings
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "configuration.settings")
 app = Celery("projects")
@@ -10,3 +11,32 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+
+@app.on_after_configure.connect
+def setup_periodic_tasks(sender, **kwargs):
+    # the scheduler requests the syncs which are due, spread across the sync interval
+    sender.add_periodic_task(
+        settings.SYNC_SCHEDULE_TICK,
+        sender.signature("projects.tasks.schedule_repository_syncs"),
+        name="schedule repository syncs",
+    )
+
+
+@signals.worker_init.connect
+def start_metrics_server(**kwargs):
+    # the pool processes of the worker share their metrics through PROMETHEUS_MULTIPROC_DIR
+    if settings.WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+
+        from projects.utils.metrics import get_registry
+
+        start_http_server(settings.WORKER_METRICS_PORT, registry=get_registry())
+
+
+@signals.worker_process_shutdown.connect
+def remove_process_metrics(pid=None, **kwargs):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
@@ -173,6 +173,70 @@ HELM_EXECUTOR_HOST = os.getenv("HELM_EXECUTOR_HOST")
 HELM_EXECUTOR_PORT = os.getenv("HELM_EXECUTOR_PORT")
 
 REPOSITORY_ROOT = os.getenv("REPOSITORY_ROOT")
+# maximum size of the cached repository clones below REPOSITORY_ROOT in bytes
+REPOSITORY_CACHE_MAX_SIZE = int(os.getenv("REPOSITORY_CACHE_MAX_SIZE", 10 * 1024 ** 3))
+
+# number of decks rendered in parallel and seconds until rendering a deck is given up
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 4))
+RENDER_TIMEOUT = int(os.getenv("RENDER_TIMEOUT", 300))
+
+# optional Redis instance shared by all workers, e.g. redis://redis:6379/0
+REDIS_URL = os.getenv("REDIS_URL")
+
+# number of value schemas cached in process and seconds they are persisted in Redis
+VALUE_SCHEMA_CACHE_SIZE = int(os.getenv("VALUE_SCHEMA_CACHE_SIZE", 256))
+VALUE_SCHEMA_CACHE_TIMEOUT = int(os.getenv("VALUE_SCHEMA_CACHE_TIMEOUT", 7 * 24 * 60 * 60))
+
+# concurrent requests to Keycloak and number of groups whose members are cached for GROUP_MEMBERS_CACHE_TIMEOUT seconds
+KEYCLOAK_WORKERS = int(os.getenv("KEYCLOAK_WORKERS", 8))
+GROUP_MEMBERS_CACHE_SIZE = int(os.getenv("GROUP_MEMBERS_CACHE_SIZE", 1024))
+GROUP_MEMBERS_CACHE_TIMEOUT = int(os.getenv("GROUP_MEMBERS_CACHE_TIMEOUT", 60))
+
+# number of parsed and validated GraphQL documents cached in process and seconds persisted queries are kept in Redis
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.getenv("GRAPHQL_DOCUMENT_CACHE_SIZE", 512))
+PERSISTED_QUERY_TIMEOUT = int(os.getenv("PERSISTED_QUERY_TIMEOUT", 30 * 24 * 60 * 60))
+
+# seconds results of GraphQL queries are cached in Redis, 0 disables the cache
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = int(os.getenv("GRAPHQL_RESPONSE_CACHE_TIMEOUT", 0))
+
+# threads per process running blocking I/O of GraphQL resolvers, e.g. requests to Keycloak
+GRAPHQL_IO_WORKERS = int(os.getenv("GRAPHQL_IO_WORKERS", 16))
+
+# seconds a sync of a project may take before another one is started and seconds a postponed sync waits for running
+# ones, doubled with every attempt, until the sync is kept pending for the next sync of the project
+SYNC_LOCK_TIMEOUT = int(os.getenv("SYNC_LOCK_TIMEOUT", 30 * 60))
+SYNC_RETRY_DELAY = int(os.getenv("SYNC_RETRY_DELAY", 10))
+SYNC_MAX_POSTPONES = int(os.getenv("SYNC_MAX_POSTPONES", 8))
+
+# Celery queues of syncs requested by users and of scheduled syncs, by default both are sent to the default queue. If
+# set, workers must consume both queues, e.g. with dedicated workers for interactive syncs.
+SYNC_INTERACTIVE_QUEUE = os.getenv("SYNC_INTERACTIVE_QUEUE") or None
+SYNC_BATCH_QUEUE = os.getenv("SYNC_BATCH_QUEUE") or None
+# syncs of each priority running at a time per organization
+SYNC_ORGANIZATION_CONCURRENCY = int(os.getenv("SYNC_ORGANIZATION_CONCURRENCY", 4))
+# syncs of all priorities running at a time
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", 32))
+
+# seconds between the scheduled syncs of a project, varied randomly by the jitter fraction, and seconds between the
+# runs of the scheduler in Celery beat
+SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", 60 * 60))
+SYNC_JITTER = float(os.getenv("SYNC_JITTER", 0.1))
+SYNC_SCHEDULE_TICK = int(os.getenv("SYNC_SCHEDULE_TICK", 60))
+# maximum seconds between the scheduled syncs of a project whose repository keeps failing
+SYNC_MAX_BACKOFF = int(os.getenv("SYNC_MAX_BACKOFF", 24 * 60 * 60))
+
+# progress events kept per project
+SYNC_PROGRESS_EVENTS = int(os.getenv("SYNC_PROGRESS_EVENTS", 100))
+
+# GraphQL operation names labelling metrics per process, further operations are labelled "other"
+GRAPHQL_METRICS_OPERATIONS = int(os.getenv("GRAPHQL_METRICS_OPERATIONS", 200))
+# port of the metrics of Celery workers, set PROMETHEUS_MULTIPROC_DIR to collect the metrics of all pool processes
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0)) or None
+# bearer token scrapers of the metrics endpoint authenticate with, the endpoint rejects all requests if it is not set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# secret of the push webhooks of spec repositories, the webhook endpoint rejects all requests if it is not set
+REPOSITORY_WEBHOOK_SECRET = os.getenv("REPOSITORY_WEBHOOK_SECRET")
 
 AUTH_USER_MODEL = "backoffice.AdminUser"
 
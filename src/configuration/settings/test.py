@@ -70,4 +70,41 @@ AUTH_USER_MODEL = "backoffice.AdminUser"
 
 GRAPHENE_PER_PAGE = 30
 
+REPOSITORY_ROOT = None
+REPOSITORY_CACHE_MAX_SIZE = 10 * 1024 ** 3
+
+RENDER_WORKERS = 4
+RENDER_TIMEOUT = 300
+
+REDIS_URL = None
+
+VALUE_SCHEMA_CACHE_SIZE = 256
+VALUE_SCHEMA_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+KEYCLOAK_WORKERS = 8
+GROUP_MEMBERS_CACHE_SIZE = 1024
+GROUP_MEMBERS_CACHE_TIMEOUT = 60
+
+GRAPHQL_DOCUMENT_CACHE_SIZE = 512
+PERSISTED_QUERY_TIMEOUT = 30 * 24 * 60 * 60
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = 0
+GRAPHQL_IO_WORKERS = 16
+
+SYNC_LOCK_TIMEOUT = 30 * 60
+SYNC_RETRY_DELAY = 10
+SYNC_MAX_POSTPONES = 8
+SYNC_INTERACTIVE_QUEUE = None
+SYNC_BATCH_QUEUE = None
+SYNC_ORGANIZATION_CONCURRENCY = 4
+SYNC_CONCURRENCY = 32
+SYNC_INTERVAL = 60 * 60
+SYNC_JITTER = 0.1
+SYNC_SCHEDULE_TICK = 60
+SYNC_MAX_BACKOFF = 24 * 60 * 60
+SYNC_PROGRESS_EVENTS = 100
+GRAPHQL_METRICS_OPERATIONS = 200
+WORKER_METRICS_PORT = None
+METRICS_TOKEN = "metrics-token"
+REPOSITORY_WEBHOOK_SECRET = "webhook-secret"
+
 CELERY_TASK_ALWAYS_EAGER = True
@@ -15,13 +15,18 @@ Including another URLconf
 """
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 
 import gql.schema as graphql_interface
+from gql.views import MeasuredGraphQLView
+from projects.views import K8sSpecsView, MetricsView, RepositoryWebhookView, SyncProgressView
 
 urlpatterns = [
     path(
         "graphql",
-        csrf_exempt(GraphQLView.as_view(graphiql=True, schema=graphql_interface.schema)),
-    )
+        csrf_exempt(MeasuredGraphQLView.as_view(graphiql=True, schema=graphql_interface.schema)),
+    ),
+    path("manifests/<uuid:environment_uuid>", K8sSpecsView.as_view()),
+    path("projects/<uuid:project_uuid>/sync-progress", SyncProgressView.as_view()),
+    path("webhooks/push", RepositoryWebhookView.as_view()),
+    path("metrics", MetricsView.as_view()),
 ]
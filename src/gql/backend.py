@@ -0,0 +1,67 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Optional
+
+from django.conf import settings
+from graphql import GraphQLCoreBackend, parse
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.validation import validate
+
+
+def get_document_hash(document_string: str) -> str:
+    return hashlib.sha256(document_string.encode()).hexdigest()
+
+
+def _invalid_document(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+class CachedGraphQLBackend(GraphQLCoreBackend):
+    """
+    Keeps the parsed and validated documents of the ``settings.GRAPHQL_DOCUMENT_CACHE_SIZE`` most recently executed
+    operations, keyed by the SHA-256 hash of their text.
+
+    Documents from the cache are executed without validating them again. Documents which failed validation are cached
+    as well and return their validation errors.
+    """
+
+    def __init__(self, executor=None):
+        super().__init__(executor=executor)
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_document(self, schema, document_hash: str) -> Optional[GraphQLDocument]:
+        """Returns the cached document with the given hash, if any."""
+        with self._lock:
+            document = self._documents.get((schema, document_hash))
+            if document is not None:
+                self._documents.move_to_end((schema, document_hash))
+            return document
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+
+        key = (schema, get_document_hash(document_string))
+        document = self.get_document(*key)
+        if document is not None:
+            return document
+
+        document_ast = parse(document_string)
+        validation_errors = validate(schema, document_ast)
+        if validation_errors:
+            execute_document = partial(_invalid_document, validation_errors)
+        else:
+            execute_document = partial(execute, schema, document_ast, **self.execute_params)
+        document = GraphQLDocument(
+            schema=schema, document_string=document_string, document_ast=document_ast, execute=execute_document
+        )
+
+        with self._lock:
+            self._documents[key] = document
+            while len(self._documents) > settings.GRAPHQL_DOCUMENT_CACHE_SIZE:
+                self._documents.popitem(last=False)
+        return document
@@ -0,0 +1,60 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Callable, Dict
+
+from django.conf import settings
+from promise import Promise
+
+
+@lru_cache(maxsize=None)
+def get_io_pool() -> ThreadPoolExecutor:
+    """Returns the thread pool running the blocking I/O of all GraphQL requests of this process."""
+    return ThreadPoolExecutor(max_workers=settings.GRAPHQL_IO_WORKERS, thread_name_prefix="graphql-io")
+
+
+class ConcurrentExecutor:
+    """
+    Executor for graphql-core running the blocking I/O of resolvers concurrently.
+
+    Resolvers and data loaders hand blocking calls, like requests to Keycloak, to ``run``, which starts them in a shared
+    thread pool and returns a promise right away, so that the execution continues with the remaining fields. The
+    promises are settled on the thread of the request in ``wait_until_finished``, hence everything depending on them,
+    including database queries, keeps running on the thread of the request.
+    """
+
+    def __init__(self):
+        self.pending: Dict[Future, Promise] = {}
+
+    def execute(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def run(self, fn: Callable, *args, **kwargs) -> Promise:
+        promise = Promise()
+        self.pending[get_io_pool().submit(fn, *args, **kwargs)] = promise
+        return promise
+
+    def wait_until_finished(self):
+        while self.pending:
+            done, _ = wait(list(self.pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                promise = self.pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    promise.do_resolve(future.result())
+                else:
+                    promise.do_reject(error)
+
+    def clean(self):
+        self.pending = {}
+
+
+def run_blocking(context, fn: Callable, *args, **kwargs) -> Promise:
+    """
+    Runs the blocking call with the executor of the request and returns a promise of its result.
+
+    The call is made right away, if the request is not executed by a ``ConcurrentExecutor``.
+    """
+    executor = getattr(context, "graphql_executor", None)
+    if isinstance(executor, ConcurrentExecutor):
+        return executor.run(fn, *args, **kwargs)
+    return Promise.resolve(None).then(lambda _: fn(*args, **kwargs))
@@ -0,0 +1,106 @@
+from collections import defaultdict
+from typing import Callable, Iterable, Type
+
+from django.db.models import Model
+from graphql import ResolveInfo
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from gql.executor import run_blocking
+from projects.models import ClusterSettings, Deck, Environment, K8SDeployment
+from projects.utils.keycloak import group_members_cache
+from sops.models.base import SOPSProvider
+
+
+class RelatedListLoader(DataLoader):
+    """Loads the related objects of many parents with one query and returns them grouped by parent key."""
+
+    def __init__(self, get_objects: Callable[[list], Iterable], get_key: Callable):
+        super().__init__()
+        self.get_objects = get_objects
+        self.get_key = get_key
+
+    def batch_load_fn(self, keys):
+        objects = defaultdict(list)
+        for obj in self.get_objects(keys):
+            objects[self.get_key(obj)].append(obj)
+        return Promise.resolve([objects.get(key, []) for key in keys])
+
+
+class RelatedObjectLoader(DataLoader):
+    """
+    Loads one related object for each of many parents with one query.
+
+    Missing objects resolve to None, unless the ``required`` model is given, whose ``DoesNotExist`` is raised for them
+    like ``QuerySet.get()`` does.
+    """
+
+    def __init__(self, get_objects: Callable[[list], Iterable], get_key: Callable, required: Type[Model] = None):
+        super().__init__()
+        self.get_objects = get_objects
+        self.get_key = get_key
+        self.required = required
+
+    def batch_load_fn(self, keys):
+        objects = {self.get_key(obj): obj for obj in self.get_objects(keys)}
+        missing = None
+        if self.required:
+            missing = self.required.DoesNotExist(f"{self.required._meta.object_name} matching query does not exist.")
+        return Promise.resolve([objects.get(key, missing) for key in keys])
+
+
+class GroupMembersLoader(DataLoader):
+    """
+    Loads the members of Keycloak groups from the shared cache, fetching all uncached groups concurrently.
+
+    The groups are loaded with the executor of the request, so that the remaining fields are resolved meanwhile.
+    """
+
+    def __init__(self, context=None):
+        super().__init__()
+        self.context = context
+
+    def batch_load_fn(self, keys):
+        return run_blocking(self.context, group_members_cache.get_members, keys).then(
+            lambda members: [members[key] for key in keys]
+        )
+
+
+class Loaders:
+    """The data loaders of one request, so that nested fields are loaded with one query per relation."""
+
+    def __init__(self, context=None):
+        self.decks_by_project = RelatedListLoader(
+            lambda keys: Deck.objects.filter(project_id__in=keys), lambda deck: deck.project_id
+        )
+        self.cluster_settings_by_project = RelatedObjectLoader(
+            lambda keys: ClusterSettings.objects.filter(project_id__in=keys),
+            lambda cluster_settings: cluster_settings.project_id,
+            required=ClusterSettings,
+        )
+        self.sops_by_project = RelatedListLoader(
+            lambda keys: SOPSProvider.objects.filter(project_id__in=keys).get_real_instances(),
+            lambda provider: provider.project_id,
+        )
+        self.sops = RelatedObjectLoader(
+            lambda keys: SOPSProvider.objects.filter(id__in=keys).get_real_instances(), lambda provider: provider.id
+        )
+        self.environments_by_deck = RelatedListLoader(
+            lambda keys: Environment.objects.filter(deck_id__in=keys), lambda environment: environment.deck_id
+        )
+        self.deployments_by_deck = RelatedListLoader(
+            lambda keys: K8SDeployment.objects.filter(environment__deck_id__in=keys).select_related("environment"),
+            lambda deployment: deployment.environment.deck_id,
+        )
+        self.group_members = GroupMembersLoader(context)
+
+
+def get_loaders(info: ResolveInfo) -> Loaders:
+    """Returns the data loaders of the current request."""
+    context = info.context
+    if context is None:
+        return Loaders()
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = context.loaders = Loaders(context)
+    return loaders
@@ -4,13 +4,18 @@ from commons.keycloak.users import UserHandler
 from django.shortcuts import get_object_or_404
 from graphene_django.forms.mutation import DjangoModelFormMutation
 from graphql import GraphQLError, ResolveInfo
+from promise import Promise
 
+from gql.executor import run_blocking
 from projects.forms import ClusterSettingsForm, EnvironmentForm
 from projects.models import Environment, HelmOverrides, Project
+from projects.utils.keycloak import group_members_cache
+from projects.utils.versions import bump_project_version
 from sops.models.aws import AWSKMS
 from sops.models.base import SOPSProvider
 from sops.models.pgp import PGPKey
 
+from .permissions import get_permissions
 from .query import ClusterSettingsNode, EnvironmentNode, ProjectNode
 
 
@@ -40,7 +45,7 @@ class CreateUpdateProject(graphene.Mutation):
     def mutate(cls, root, info, **kwargs):
         project_node = kwargs.get("input")
         if project_node.id:
-            if info.context.permissions.has_permission(str(project_node.id), "project:edit"):
+            if get_permissions(info).has_permission(str(project_node.id), "project:edit"):
                 try:
                     project_db = get_object_or_404(Project, id=project_node.id)
                     for field in project_node._meta.fields.keys():
@@ -52,7 +57,7 @@ class CreateUpdateProject(graphene.Mutation):
             else:
                 raise GraphQLError("No permission to edit the project.")
         else:
-            if project_node.organization and info.context.permissions.has_permission(
+            if project_node.organization and get_permissions(info).has_permission(
                 str(project_node.organization), "organization:projects:add"
             ):
                 create_kwargs = {field: getattr(project_node, field) for field in project_node._meta.fields.keys()}
@@ -70,6 +75,8 @@ class CreateUpdateProject(graphene.Mutation):
         uh = UserHandler()
         admin_group = project_db.keycloak_data["groups"].get(KeycloakResource.ADMINS)
         uh.join_group(info.context.kcuser["uuid"], admin_group)
+        group_members_cache.invalidate(admin_group)
+        bump_project_version(project_db.pk)
         return cls(project=project_db)
 
     class Meta:
@@ -91,19 +98,21 @@ class CreateProjectMember(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, **kwargs):
-        if info.context.permissions.has_permission(str(kwargs.get("id")), "project:edit"):
+        if get_permissions(info).has_permission(str(kwargs.get("id")), "project:edit"):
             project = Project.objects.get(id=kwargs.get("id"))
             try:
                 # we currently accept every user to be added to the project (also user not part of the orga)
                 if kwargs.get("role") == ProjectMemberRoleEnum.admin:
-                    UserHandler().join_group(
-                        str(kwargs.get("user")), project.keycloak_data["groups"].get(KeycloakResource.ADMINS)
-                    )
+                    group = project.keycloak_data["groups"].get(KeycloakResource.ADMINS)
+                    UserHandler().join_group(str(kwargs.get("user")), group)
+                    group_members_cache.invalidate(group)
+                    bump_project_version(project.pk)
                     return cls(ok=True)
                 elif kwargs.get("role") == ProjectMemberRoleEnum.member:
-                    UserHandler().join_group(
-                        str(kwargs.get("user")), project.keycloak_data["groups"].get(KeycloakResource.MEMBERS)
-                    )
+                    group = project.keycloak_data["groups"].get(KeycloakResource.MEMBERS)
+                    UserHandler().join_group(str(kwargs.get("user")), group)
+                    group_members_cache.invalidate(group)
+                    bump_project_version(project.pk)
                     return cls(ok=True)
                 else:
                     return cls(ok=False)
@@ -122,18 +131,27 @@ class DeleteProjectMember(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, **kwargs):
-        if info.context.permissions.has_permission(str(kwargs.get("id")), "project:edit"):
+        if get_permissions(info).has_permission(str(kwargs.get("id")), "project:edit"):
             project = Project.objects.get(id=kwargs.get("id"))
-            try:
-                UserHandler().leave_group(
-                    str(kwargs.get("user")), project.keycloak_data["groups"].get(KeycloakResource.ADMINS)
-                )
-                UserHandler().leave_group(
-                    str(kwargs.get("user")), project.keycloak_data["groups"].get(KeycloakResource.MEMBERS)
-                )
+            admin_group = project.keycloak_data["groups"].get(KeycloakResource.ADMINS)
+            member_group = project.keycloak_data["groups"].get(KeycloakResource.MEMBERS)
+            user = str(kwargs.get("user"))
+
+            def left_groups(_):
+                group_members_cache.invalidate(admin_group, member_group)
+                bump_project_version(project.pk)
                 return cls(ok=True)
-            except Exception:
+
+            def failed(_):
+                left_groups(None)
                 raise GraphQLError("Could not remove this user from project.")
+
+            # both groups are left concurrently
+            leave = [
+                run_blocking(info.context, UserHandler().leave_group, user, group)
+                for group in (admin_group, member_group)
+            ]
+            return Promise.all(leave).then(left_groups, failed)
         else:
             raise GraphQLError("This user does not have permission to remove a user from this project.")
 
@@ -146,9 +164,10 @@ class DeleteProject(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, **kwargs):
-        if info.context.permissions.has_permission(str(kwargs.get("id")), "project:edit"):
+        if get_permissions(info).has_permission(str(kwargs.get("id")), "project:edit"):
             obj = Project.objects.get(id=kwargs.get("id"))
             obj.delete()
+            bump_project_version(kwargs.get("id"))
             return cls(ok=True)
         else:
             raise GraphQLError("This user does not have permission to remove this project.")
@@ -162,7 +181,7 @@ class UpdateProjectRepository(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, **kwargs):
-        if info.context.permissions.has_permission(str(kwargs.get("id")), "project:edit"):
+        if get_permissions(info).has_permission(str(kwargs.get("id")), "project:edit"):
             project = Project.objects.get(id=kwargs["id"])
             project.update_repository()
             return cls(ok=True)
@@ -246,6 +265,7 @@ class CreateUpdateSOPS(graphene.Mutation):
                 )
             else:
                 raise GraphQLError(f"Unsupported SOPS type {sops_data.sops_type}.")
+        bump_project_version(project.pk)
         return cls(ok=True)
 
 
@@ -258,7 +278,9 @@ class DeleteSOPS(graphene.Mutation):
     @classmethod
     def mutate(cls, root, info: ResolveInfo, **kwargs):
         pk = kwargs.get("id")
-        SOPSProvider.objects.get(id=pk).delete()
+        sops_provider = SOPSProvider.objects.get(id=pk)
+        sops_provider.delete()
+        bump_project_version(sops_provider.project_id)
         return cls(ok=True)
 
 
@@ -270,6 +292,12 @@ class CreateUpdateEnvironment(DjangoModelFormMutation):
         convert_choices_to_enum = True
         return_field_name = "environment"
 
+    @classmethod
+    def perform_mutate(cls, form, info):
+        result = super().perform_mutate(form, info)
+        bump_project_version(form.instance.deck.project_id)
+        return result
+
 
 class DeleteEnvironment(graphene.Mutation):
     class Arguments:
@@ -281,6 +309,7 @@ class DeleteEnvironment(graphene.Mutation):
     def mutate(cls, root, info, **kwargs):
         obj = Environment.objects.get(id=kwargs.get("id"))
         obj.delete()
+        bump_project_version(obj.deck.project_id)
         return cls(ok=True)
 
 
@@ -292,6 +321,12 @@ class UpdateClusterSettings(DjangoModelFormMutation):
         convert_choices_to_enum = True
         return_field_name = "cluster_settings"
 
+    @classmethod
+    def perform_mutate(cls, form, info):
+        result = super().perform_mutate(form, info)
+        bump_project_version(form.instance.project_id)
+        return result
+
 
 class CreateUpdateHelmOverrides(graphene.Mutation):
     class Arguments:
@@ -304,13 +339,14 @@ class CreateUpdateHelmOverrides(graphene.Mutation):
     def mutate(cls, root, info, **kwargs):
         environment = Environment.objects.get(id=kwargs.get("environment_id"))
         project_id = environment.deck.project.id
-        if info.context.permissions.has_permission(str(project_id), "project:edit"):
+        if get_permissions(info).has_permission(str(project_id), "project:edit"):
             HelmOverrides.objects.update_or_create(
                 environment_id=environment.id,
                 defaults={
                     "overrides": kwargs.get("overrides"),
                 },
             )
+            bump_project_version(project_id)
         else:
             raise GraphQLError("Environment does not exist.")
         return cls(ok=True)
@@ -0,0 +1,59 @@
+from typing import Iterable, Set
+
+from django.db.models import QuerySet
+from graphene.utils.str_converters import to_snake_case
+from graphql import ResolveInfo
+from graphql.language import ast
+
+
+def _iter_fields(selection_set: ast.SelectionSet, fragments: dict) -> Iterable[ast.Field]:
+    """Yields the fields of the selection set, including the fields selected by (inline) fragments."""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.InlineFragment):
+            yield from _iter_fields(selection.selection_set, fragments)
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from _iter_fields(fragment.selection_set, fragments)
+
+
+def get_selected_fields(info: ResolveInfo, *path: str) -> Set[str]:
+    """
+    Returns the snake case names of the fields the client selected below the resolved field.
+
+    The path selects nested fields by their GraphQL names, e.g. ``get_selected_fields(info, "results")`` returns the
+    fields selected for the results of a page.
+    """
+    fields = [field for field_ast in info.field_asts for field in _iter_fields(field_ast.selection_set, info.fragments)]
+    for name in path:
+        fields = [
+            nested
+            for field in fields
+            if field.name.value == name
+            for nested in _iter_fields(field.selection_set, info.fragments)
+        ]
+    return {to_snake_case(field.name.value) for field in fields}
+
+
+def optimize_projects(projects: QuerySet, info: ResolveInfo, *path: str) -> QuerySet:
+    """Loads the related rows of the selected project fields along with the projects and skips unused JSON columns."""
+    fields = get_selected_fields(info, *path)
+    if "cluster_settings" in fields:
+        projects = projects.select_related("cluster_settings")
+    if "members" not in fields:
+        projects = projects.defer("keycloak_data")
+    return projects
+
+
+def optimize_decks(decks: QuerySet, info: ResolveInfo, *path: str) -> QuerySet:
+    """Loads the related rows of the selected deck fields along with the decks and skips unused JSON columns."""
+    fields = get_selected_fields(info, *path)
+    if "project" in fields:
+        decks = decks.select_related("project")
+    if "file_information" not in fields:
+        decks = decks.defer("file_information")
+    return decks
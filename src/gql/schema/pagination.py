@@ -0,0 +1,35 @@
+import base64
+import binascii
+import uuid
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from graphql import GraphQLError
+
+# objects are paginated by their creation date, the primary key breaks ties
+ORDERING = ("created", "id")
+
+
+def encode_cursor(obj) -> str:
+    """Returns the opaque cursor of the object, which is passed as ``after`` to continue after the object."""
+    return base64.urlsafe_b64encode(f"{obj.created.isoformat()}|{obj.id}".encode()).decode()
+
+
+def paginate_after(queryset: QuerySet, after: str = None) -> QuerySet:
+    """
+    Orders the queryset by creation date and keeps only the objects after the cursor.
+
+    The filter uses the ``(created, id)`` index, so every page is as fast as the first one, in contrast to offsets.
+    """
+    queryset = queryset.order_by(*ORDERING)
+    if not after:
+        return queryset
+    try:
+        created, _, pk = base64.urlsafe_b64decode(after.encode()).decode().partition("|")
+        created = parse_datetime(created)
+        pk = uuid.UUID(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        created = None
+    if created is None:
+        raise GraphQLError("Invalid cursor.")
+    return queryset.filter(Q(created__gt=created) | Q(created=created, id__gt=pk))
@@ -0,0 +1,46 @@
+from typing import FrozenSet
+
+from graphql import ResolveInfo
+
+
+class RequestPermissions:
+    """
+    The Keycloak permissions of one request.
+
+    The resources granted for a scope are decoded once per request and kept as a frozenset, so that checking a
+    resource is a set lookup. Single permission checks are memoized as well.
+    """
+
+    def __init__(self, permissions):
+        self.permissions = permissions
+        self._resources = {}
+        self._checks = {}
+
+    def get_resource_ids(self, scope: str) -> FrozenSet[str]:
+        if scope not in self._resources:
+            self._resources[scope] = frozenset(str(rsid) for rsid in self.permissions.get_resource_id_by_scope(scope))
+        return self._resources[scope]
+
+    def has_permission(self, resource_id, scope: str) -> bool:
+        key = (str(resource_id), scope)
+        if key not in self._checks:
+            self._checks[key] = self.permissions.has_permission(*key)
+        return self._checks[key]
+
+
+def get_request_permissions(request) -> RequestPermissions:
+    """Returns the permissions of the request."""
+    permissions = getattr(request, "request_permissions", None)
+    if permissions is None or permissions.permissions is not request.permissions:
+        permissions = request.request_permissions = RequestPermissions(request.permissions)
+    return permissions
+
+
+def get_permissions(info: ResolveInfo) -> RequestPermissions:
+    """Returns the permissions of the current request."""
+    return get_request_permissions(info.context)
+
+
+def get_allowed_projects(info: ResolveInfo) -> FrozenSet[str]:
+    """Returns the IDs of the projects the current request may access."""
+    return get_permissions(info).get_resource_ids("project:*")
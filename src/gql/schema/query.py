@@ -3,15 +3,17 @@ import uuid
 import graphene
 from commons.graphql.nodes import page_field_factory, resolve_page
 from commons.keycloak.abstract_models import KeycloakResource
-from commons.keycloak.groups import GroupHandler
 from graphene import UUID, ObjectType
 from graphene_django import DjangoObjectType
 from graphene_federation import extend, external, key
 from graphql import GraphQLError, ResolveInfo
 
+from gql.schema.loaders import get_loaders
+from gql.schema.optimizer import optimize_decks, optimize_projects
+from gql.schema.pagination import encode_cursor, paginate_after
+from gql.schema.permissions import get_allowed_projects
 from projects.models import ClusterSettings, Deck, Environment, HelmOverrides, K8SDeployment, Project
 from sops.models.aws import AWSKMS
-from sops.models.base import SOPSProvider
 from sops.models.pgp import PGPKey
 
 
@@ -40,10 +42,14 @@ class DeckNode(DjangoObjectType):
     deployments = graphene.List(lambda: DeploymentNode, level=graphene.String(), switchable=graphene.Boolean())
     environment = graphene.List(lambda: EnvironmentNode, level=graphene.String())
     file_information = graphene.List(lambda: FileInformationNode)
+    cursor = graphene.String()
 
     class Meta:
         model = Deck
-        exclude = ("environments",)
+        exclude = ("environments", "tree_hash", "values_hash")
+
+    def resolve_cursor(self, info):
+        return encode_cursor(self)
 
     def resolve_file_information(self, info):
         result = []
@@ -53,18 +59,21 @@ class DeckNode(DjangoObjectType):
         return result
 
     def resolve_deployments(self, info, level=None, switchable=None):
-        deployments = K8SDeployment.objects.filter(environment__deck=self)
-        if level is not None:
-            deployments = deployments.filter(environment__type=level)
-        if switchable is not None:
-            deployments = deployments.filter(is_switchable=switchable)
-        return deployments
+        def filter_deployments(deployments):
+            return [
+                deployment
+                for deployment in deployments
+                if (level is None or deployment.environment.type == level)
+                and (switchable is None or deployment.is_switchable == switchable)
+            ]
+
+        return get_loaders(info).deployments_by_deck.load(self.id).then(filter_deployments)
 
     def resolve_environment(self, info, level=None):
-        environment = Environment.objects.filter(deck=self)
+        environments = get_loaders(info).environments_by_deck.load(self.id)
         if level is not None:
-            return environment.filter(type=level)
-        return environment
+            return environments.then(lambda environments: [env for env in environments if env.type == level])
+        return environments
 
 
 class DeploymentNode(DjangoObjectType):
@@ -124,9 +133,13 @@ class ProjectNode(DjangoObjectType):
     sops = graphene.List(SOPSProviderNode)
     members = graphene.List(ProjectMember)
     cluster_settings = graphene.Field(ClusterSettingsNode)
+    cursor = graphene.String()
+
+    def resolve_cursor(self, info):
+        return encode_cursor(self)
 
     def resolve_decks(self, info: ResolveInfo, **kwargs):
-        return Deck.objects.filter(project=self)
+        return get_loaders(info).decks_by_project.load(self.id)
 
     def resolve_organization(self, info: ResolveInfo, **kwargs):
         return OrganizationNode(id=self.organization)
@@ -137,26 +150,32 @@ class ProjectNode(DjangoObjectType):
         return str(bool(self.access_token))
 
     def resolve_cluster_settings(self, info, **kwargs):
-        return ClusterSettings.objects.get(project=self)
+        if Project.cluster_settings.related.is_cached(self):
+            # the cluster settings were selected along with the project
+            return self.cluster_settings
+        return get_loaders(info).cluster_settings_by_project.load(self.id)
 
     def resolve_sops(self, info: ResolveInfo, **kwargs):
-        return SOPSProvider.objects.filter(project=self).get_real_instances()
+        return get_loaders(info).sops_by_project.load(self.id)
 
     def resolve_members(self, info, **kwargs):
-        member_list = []
-        gh = GroupHandler()
         admin_group = self.keycloak_data["groups"].get(KeycloakResource.ADMINS)
         member_group = self.keycloak_data["groups"].get(KeycloakResource.MEMBERS)
-        admins = gh.members(admin_group)
-        for a in admins:
-            member_list.append(ProjectMember(user=UserNode(id=a["id"]), role="admin"))
-        members = gh.members(member_group)
-        for m in members:
-            member_list.append(ProjectMember(user=UserNode(id=m["id"]), role="member"))
-        return member_list
+
+        def get_member_list(groups):
+            admins, members = groups
+            member_list = []
+            for a in admins:
+                member_list.append(ProjectMember(user=UserNode(id=a["id"]), role="admin"))
+            for m in members:
+                member_list.append(ProjectMember(user=UserNode(id=m["id"]), role="member"))
+            return member_list
+
+        return get_loaders(info).group_members.load_many([admin_group, member_group]).then(get_member_list)
 
     class Meta:
         model = Project
+        exclude = ("next_sync", "sync_failures")
 
 
 class HelmOverridesNode(DjangoObjectType):
@@ -178,8 +197,8 @@ class EnvironmentNode(DjangoObjectType):
         return f"/manifests/{self.id}"
 
     def resolve_sops_credentials(self, info, **kwargs):
-        if self.sops_credentials:
-            return self.sops_credentials.get_real_instance()
+        if self.sops_credentials_id:
+            return get_loaders(info).sops.load(self.sops_credentials_id)
         return None
 
     class Meta:
@@ -187,35 +206,39 @@ class EnvironmentNode(DjangoObjectType):
 
 
 class Query(graphene.ObjectType):
-    all_projects = page_field_factory(ProjectNode, organization_id=graphene.UUID())
+    all_projects = page_field_factory(ProjectNode, organization_id=graphene.UUID(), after=graphene.String())
     project = graphene.Field(ProjectNode, id=graphene.UUID(), slug=graphene.String())
 
-    all_decks = page_field_factory(DeckNode, organization_id=graphene.UUID(), project_id=graphene.UUID())
+    all_decks = page_field_factory(
+        DeckNode, organization_id=graphene.UUID(), project_id=graphene.UUID(), after=graphene.String()
+    )
     deck = graphene.Field(DeckNode, id=graphene.UUID(), slug=graphene.String())
 
     environment = graphene.Field(EnvironmentNode, id=graphene.UUID())
 
     @resolve_page
-    def resolve_all_projects(self, info, organization_id: uuid = None, **kwargs):
-        allowed_projects = info.context.permissions.get_resource_id_by_scope("project:*")
+    def resolve_all_projects(self, info, organization_id: uuid = None, after: str = None, **kwargs):
+        allowed_projects = get_allowed_projects(info)
         projects = Project.objects.filter(id__in=allowed_projects)
 
         # filter
         if organization_id:
             projects = projects.filter(organization__exact=organization_id)
 
-        return projects
+        return optimize_projects(paginate_after(projects, after), info, "results")
 
     def resolve_project(self, info, id: uuid = None):
         # check if this project is allowed to be resolved
-        allowed_projects = info.context.permissions.get_resource_id_by_scope("project:*")
+        allowed_projects = get_allowed_projects(info)
         if str(id) not in allowed_projects:
             raise GraphQLError("This project cannot be retrieved.")
         return Project.objects.get(id=id)
 
     @resolve_page
-    def resolve_all_decks(self, info, organization_id: uuid = None, project_id: uuid = None, **kwargs):
-        allowed_projects = info.context.permissions.get_resource_id_by_scope("project:*")
+    def resolve_all_decks(
+        self, info, organization_id: uuid = None, project_id: uuid = None, after: str = None, **kwargs
+    ):
+        allowed_projects = get_allowed_projects(info)
         decks = Deck.objects.filter(project__id__in=allowed_projects)
 
         # filter
@@ -225,14 +248,14 @@ class Query(graphene.ObjectType):
         if project_id:
             decks = decks.filter(project__id__exact=project_id)
 
-        return decks
+        return optimize_decks(paginate_after(decks, after), info, "results")
 
     def resolve_deck(self, info, id: uuid = None):
         # TODO: check if this deck is allowed to be resolved
         return Deck.objects.get(id=id)
 
     def resolve_environment(self, info, id: str):
-        allowed_projects = info.context.permissions.get_resource_id_by_scope("project:*")
+        allowed_projects = get_allowed_projects(info)
         try:
             environment = Environment.objects.get(id=id)
         except Environment.DoesNotExist:
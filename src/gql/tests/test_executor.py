@@ -0,0 +1,53 @@
+import threading
+from types import SimpleNamespace
+
+import graphene
+from django.test import SimpleTestCase
+
+from gql.executor import ConcurrentExecutor, run_blocking
+
+
+class Query(graphene.ObjectType):
+    first = graphene.String()
+    second = graphene.String()
+    failing = graphene.String()
+
+    def resolve_first(self, info):
+        return run_blocking(info.context, info.context.barrier.wait).then(lambda _: threading.get_ident())
+
+    def resolve_second(self, info):
+        return run_blocking(info.context, info.context.barrier.wait).then(lambda _: threading.get_ident())
+
+    def resolve_failing(self, info):
+        def fail():
+            raise ValueError("Keycloak is not available.")
+
+        return run_blocking(info.context, fail)
+
+
+schema = graphene.Schema(query=Query)
+
+
+class ConcurrentExecutorTest(SimpleTestCase):
+    def execute(self, query, executor=None):
+        # the calls only pass the barrier, if they are made concurrently
+        context = SimpleNamespace(graphql_executor=executor, barrier=threading.Barrier(2, timeout=5))
+        return schema.execute(query, context=context, executor=executor)
+
+    def test_blocking_calls_run_concurrently(self):
+        result = self.execute("{ first second }", ConcurrentExecutor())
+
+        self.assertIsNone(result.errors)
+        # the promises are settled on the thread of the request
+        self.assertEqual(result.data, {"first": str(threading.get_ident()), "second": str(threading.get_ident())})
+
+    def test_blocking_call_fails(self):
+        result = self.execute("{ failing }", ConcurrentExecutor())
+
+        self.assertEqual(result.data, {"failing": None})
+        self.assertEqual([str(error) for error in result.errors], ["Keycloak is not available."])
+
+    def test_blocking_call_without_concurrent_executor(self):
+        result = self.execute("{ failing }")
+
+        self.assertEqual([str(error) for error in result.errors], ["Keycloak is not available."])
@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from gql.schema.permissions import get_allowed_projects, get_permissions
+
+
+class RequestPermissionsTest(SimpleTestCase):
+    def test_permissions_are_decoded_once_per_request(self):
+        permissions = mock.Mock()
+        permissions.get_resource_id_by_scope.return_value = ["a", "b"]
+        permissions.has_permission.return_value = True
+        info = SimpleNamespace(context=SimpleNamespace(permissions=permissions))
+
+        self.assertEqual(get_allowed_projects(info), frozenset({"a", "b"}))
+        self.assertEqual(get_allowed_projects(info), frozenset({"a", "b"}))
+        self.assertTrue(get_permissions(info).has_permission("a", "project:edit"))
+        self.assertTrue(get_permissions(info).has_permission("a", "project:edit"))
+        permissions.get_resource_id_by_scope.assert_called_once_with("project:*")
+        permissions.has_permission.assert_called_once_with("a", "project:edit")
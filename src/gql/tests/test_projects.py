@@ -5,10 +5,15 @@ from commons.keycloak.abstract_models import KeycloakResource
 from commons.keycloak.permissions import KeycloakPermissions
 from commons.keycloak.testing.driver import KeycloakDriver
 from commons.keycloak.users import UserHandler
+from django.db import connection
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from environs import Env
 
 from gql.tests import SnapshotGraphQLTestCase
+from projects.models import ClusterSettings
+from projects.tests.factories.environment import EnvironmentFactory
+from projects.tests.factories.package import DeckFactory
 from projects.tests.factories.project import ProjectFactory
 
 
@@ -79,6 +84,89 @@ class ProjectTests(SnapshotGraphQLTestCase):
         self.assertMatchSnapshot(result)
         self.assertEqual(len(result["data"]["allProjects"]["results"]), n)
 
+    def test_list_projects_queries(self):
+        query = """
+            query {
+                allProjects {
+                    results {
+                        title
+                        decks {
+                            title
+                            deployments {
+                                title
+                            }
+                            environment {
+                                type
+                            }
+                        }
+                    }
+                }
+            }
+        """
+
+        def count_queries(projects):
+            for project in projects:
+                for i in range(2):
+                    deck = DeckFactory.create(project=project, hash=f"{project.pk}-{i}")
+                    EnvironmentFactory.create(deck=deck, type="local")
+            with CaptureQueriesContext(connection) as queries:
+                result = self.client.execute(query, context=self.get_kc_permission_context(projects))
+            self.assertNotIn("errors", result)
+            return len(queries)
+
+        # nested fields are loaded with one query per relation, regardless of the number of projects
+        self.assertEqual(count_queries(ProjectFactory.create_batch(1)), count_queries(ProjectFactory.create_batch(5)))
+
+    def test_list_projects_cluster_settings_queries(self):
+        projects = ProjectFactory.create_batch(3)
+        for port, project in enumerate(projects):
+            ClusterSettings.objects.update_or_create(project=project, defaults={"port": port})
+        query = """
+            query {
+                allProjects {
+                    results {
+                        title
+                        ...ClusterSettings
+                    }
+                }
+            }
+
+            fragment ClusterSettings on ProjectNode {
+                clusterSettings {
+                    port
+                }
+            }
+        """
+        context = self.get_kc_permission_context(projects)
+        with CaptureQueriesContext(connection) as titles_queries:
+            self.client.execute("query { allProjects { results { title } } }", context=context)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute(query, context=context)
+        self.assertNotIn("errors", result)
+        # the cluster settings are selected along with the projects
+        self.assertEqual(len(queries), len(titles_queries))
+
+    def test_list_projects_after_cursor(self):
+        projects = ProjectFactory.create_batch(5)
+        query = """
+            query($after: String) {
+                allProjects(after: $after, perPage: 2) {
+                    results {
+                        id
+                        cursor
+                    }
+                }
+            }
+        """
+        context = self.get_kc_permission_context(projects)
+        ids, after = [], None
+        for _ in range(3):
+            result = self.client.execute(query, variables={"after": after}, context=context)
+            results = result["data"]["allProjects"]["results"]
+            ids += [project["id"] for project in results]
+            after = results[-1]["cursor"]
+        self.assertEqual(ids, [str(project.id) for project in sorted(projects, key=lambda p: (p.created, p.id))])
+
     def test_create_project(self):
         scopes = ["organization:projects:add"]
         organization_id = "3c11eb31-38c6-470d-b72d-52851fe90aa9"
@@ -0,0 +1,160 @@
+import hashlib
+import json
+from unittest import mock
+
+import fakeredis
+from django.test import RequestFactory, TestCase, override_settings
+from graphene_django.views import GraphQLView
+from graphql import GraphQLError
+from graphql.execution import ExecutionResult
+from prometheus_client import REGISTRY
+
+from gql.backend import CachedGraphQLBackend
+from gql.schema import schema
+from gql.views import CachedGraphQLView, ConcurrentGraphQLView, MeasuredGraphQLView, PersistedQueryGraphQLView
+from projects.utils.versions import bump_project_version
+
+
+class PersistedQueryGraphQLViewTest(TestCase):
+    query = "{ __typename }"
+
+    def setUp(self):
+        self.view = PersistedQueryGraphQLView.as_view(schema=schema, backend=CachedGraphQLBackend())
+
+    def execute(self, data):
+        request = RequestFactory().post("/graphql", json.dumps(data), content_type="application/json")
+        response = self.view(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_persisted_query(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(self.query.encode()).hexdigest()}}
+
+        status, result = self.execute({"extensions": extensions})
+        self.assertEqual(status, 200)
+        self.assertEqual(result["errors"][0]["extensions"], {"code": "PERSISTED_QUERY_NOT_FOUND"})
+
+        expected = (200, {"data": {"__typename": "Query"}})
+        self.assertEqual(self.execute({"query": self.query, "extensions": extensions}), expected)
+        self.assertEqual(self.execute({"extensions": extensions}), expected)
+
+    def test_persisted_query_hash_mismatch(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}
+        status, _ = self.execute({"query": self.query, "extensions": extensions})
+        self.assertEqual(status, 400)
+
+    def test_documents_are_validated_once(self):
+        self.execute({"query": self.query})
+        with mock.patch("gql.backend.parse") as parse, mock.patch("gql.backend.validate") as validate:
+            self.assertEqual(self.execute({"query": self.query}), (200, {"data": {"__typename": "Query"}}))
+        parse.assert_not_called()
+        validate.assert_not_called()
+
+        status, result = self.execute({"query": "{ unknown }"})
+        self.assertEqual(status, 400)
+        self.assertEqual(self.execute({"query": "{ unknown }"}), (status, result))
+
+
+@override_settings(GRAPHQL_RESPONSE_CACHE_TIMEOUT=60)
+class CachedGraphQLViewTest(TestCase):
+    query = "{ __typename }"
+
+    def setUp(self):
+        redis = fakeredis.FakeStrictRedis()
+        for target in ("gql.views.get_redis", "projects.utils.versions.get_redis"):
+            patcher = mock.patch(target, return_value=redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # versions are bumped once the transaction is committed, which never happens in a test case
+        patcher = mock.patch("projects.utils.versions.transaction.on_commit", side_effect=lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            ConcurrentGraphQLView,
+            "execute_graphql_request",
+            autospec=True,
+            side_effect=GraphQLView.execute_graphql_request,
+        )
+        self.executed = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, data, projects=("project-1",), **headers):
+        request = RequestFactory().post("/graphql", json.dumps(data), content_type="application/json", **headers)
+        request.permissions = mock.Mock(get_resource_id_by_scope=mock.Mock(return_value=list(projects)))
+        response = CachedGraphQLView.as_view(schema=schema)(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_queries_are_cached(self):
+        expected = (200, {"data": {"__typename": "Query"}})
+        self.assertEqual(self.execute({"query": self.query}), expected)
+        self.assertEqual(self.execute({"query": "{\n  __typename\n}"}), expected)
+        self.assertEqual(self.executed.call_count, 1)
+
+    def test_persisted_queries_are_cached(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(self.query.encode()).hexdigest()}}
+        view = PersistedQueryGraphQLView.as_view(schema=schema)
+        expected = {"data": {"__typename": "Query"}}
+        for data in ({"query": self.query, "extensions": extensions}, {"extensions": extensions}):
+            request = RequestFactory().post("/graphql", json.dumps(data), content_type="application/json")
+            request.permissions = mock.Mock(get_resource_id_by_scope=mock.Mock(return_value=["project-1"]))
+            self.assertEqual(json.loads(view(request).content), expected)
+        self.assertEqual(self.executed.call_count, 1)
+
+    def test_changes_of_allowed_projects_invalidate_results(self):
+        self.execute({"query": self.query})
+        bump_project_version("project-2")
+        self.execute({"query": self.query})
+        self.assertEqual(self.executed.call_count, 1)
+
+        # mutations and repository updates
+        bump_project_version("project-1")
+        self.execute({"query": self.query})
+        bump_project_version("project-1", commit="abc123")
+        self.execute({"query": self.query})
+        self.assertEqual(self.executed.call_count, 3)
+
+    def test_results_are_keyed_by_permissions_and_internal_requests(self):
+        self.execute({"query": self.query})
+        self.execute({"query": self.query}, projects=("project-1", "project-2"))
+        self.execute({"query": self.query}, projects=())
+        self.execute({"query": self.query}, HTTP_X_INTERNAL="true")
+        self.assertEqual(self.executed.call_count, 4)
+
+        self.execute({"query": self.query}, projects=("project-1", "project-2"))
+        self.execute({"query": self.query}, HTTP_X_INTERNAL="true")
+        self.assertEqual(self.executed.call_count, 4)
+
+    def test_mutations_are_not_cached(self):
+        self.executed.side_effect = None
+        self.executed.return_value = ExecutionResult(data={"deleteProject": {"ok": True}})
+        mutation = 'mutation { deleteProject(id: "00000000-0000-0000-0000-000000000000") { ok } }'
+        self.execute({"query": mutation})
+        self.execute({"query": mutation})
+        self.assertEqual(self.executed.call_count, 2)
+
+    def test_errors_are_not_cached(self):
+        self.executed.side_effect = None
+        self.executed.return_value = ExecutionResult(data={"__typename": None}, errors=[GraphQLError("failed")])
+        self.execute({"query": self.query})
+        self.execute({"query": self.query})
+        self.assertEqual(self.executed.call_count, 2)
+
+
+class MeasuredGraphQLViewTest(TestCase):
+    def execute(self, data):
+        request = RequestFactory().post("/graphql", json.dumps(data), content_type="application/json")
+        return MeasuredGraphQLView.as_view(schema=schema)(request)
+
+    def get_count(self, name, **labels):
+        return REGISTRY.get_sample_value(f"{name}_count", labels) or 0
+
+    def test_requests_are_measured_by_operation(self):
+        succeeded = self.get_count("gql_request_seconds", operation="Typename", outcome="success")
+        failed = self.get_count("gql_request_seconds", operation="anonymous", outcome="error")
+        queries = self.get_count("gql_request_queries", operation="Typename")
+
+        self.execute({"query": "query Typename { __typename }", "operationName": "Typename"})
+        self.execute({"query": "{ unknown }"})
+
+        self.assertEqual(self.get_count("gql_request_seconds", operation="Typename", outcome="success"), succeeded + 1)
+        self.assertEqual(self.get_count("gql_request_seconds", operation="anonymous", outcome="error"), failed + 1)
+        self.assertEqual(self.get_count("gql_request_queries", operation="Typename"), queries + 1)
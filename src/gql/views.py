@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponseBadRequest
+from graphene_django.views import GraphQLView, HttpError
+from graphql import GraphQLError, print_ast
+from graphql.execution import ExecutionResult
+from redis import RedisError
+
+from gql.backend import CachedGraphQLBackend, get_document_hash
+from gql.executor import ConcurrentExecutor
+from gql.schema.permissions import get_request_permissions
+from projects.utils.metrics import get_operation_label, graphql_request_queries, graphql_request_seconds
+from projects.utils.redis import get_redis
+from projects.utils.versions import get_project_versions
+
+logger = logging.getLogger("gql.views")
+
+PERSISTED_QUERY_KEY_PREFIX = "gql:persisted-query:"
+RESPONSE_KEY_PREFIX = "gql:response:"
+
+
+class ConcurrentGraphQLView(GraphQLView):
+    """
+    GraphQL view executing every request with its own ``ConcurrentExecutor``.
+
+    Blocking I/O of the resolvers runs concurrently within the request, the executor is available to the resolvers as
+    ``info.context.graphql_executor``.
+    """
+
+    def __init__(self, executor=None, **kwargs):
+        super().__init__(executor=executor or ConcurrentExecutor(), **kwargs)
+
+    def get_context(self, request):
+        context = super().get_context(request)
+        context.graphql_executor = self.executor
+        return context
+
+
+class CachedGraphQLView(ConcurrentGraphQLView):
+    """
+    GraphQL view caching the results of queries in Redis for ``settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT`` seconds.
+
+    The cache is disabled unless the timeout is set and ``settings.REDIS_URL`` is configured. Results are keyed by the
+    normalized document, the variables, the operation name, the projects the caller may access and the version of each
+    of these projects. The versions are bumped whenever a project is updated from its repository or changed by a
+    mutation, which invalidates exactly the results that include the project. Mutations are never cached.
+    """
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        if not settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT or not query or get_redis() is None:
+            return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+            cacheable = document.get_operation_type(operation_name) == "query"
+        except Exception:
+            # invalid documents are reported by the actual execution
+            cacheable = False
+        key = self.get_response_key(request, document, variables, operation_name) if cacheable else None
+        if key is None:
+            return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        redis = get_redis()
+        try:
+            cached = redis.get(key)
+        except RedisError as e:
+            logger.warning(f"Could not load response from Redis: {e}")
+            cached = None
+        if cached is not None:
+            return ExecutionResult(data=json.loads(zlib.decompress(cached)))
+
+        result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        if result is not None and not result.errors and not result.invalid:
+            try:
+                redis.set(
+                    key,
+                    zlib.compress(json.dumps(result.data, separators=(",", ":")).encode()),
+                    ex=settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT,
+                )
+            except RedisError as e:
+                logger.warning(f"Could not store response in Redis: {e}")
+        return result
+
+    def get_response_key(self, request, document, variables, operation_name):
+        """Returns the cache key of the result, or None if the result must not be cached."""
+        allowed_projects = sorted(get_request_permissions(request).get_resource_ids("project:*"))
+        versions = get_project_versions(allowed_projects)
+        if versions is None:
+            return None
+        key_data = [
+            print_ast(document.document_ast),
+            variables or {},
+            operation_name,
+            bool(request.headers.get("x-internal")),
+            allowed_projects,
+            versions,
+        ]
+        digest = hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+        return RESPONSE_KEY_PREFIX + digest
+
+
+class PersistedQueryGraphQLView(CachedGraphQLView):
+    """
+    GraphQL view executing documents from the document cache of ``CachedGraphQLBackend``.
+
+    Supports automatic persisted queries as implemented by Apollo clients: a client sends the SHA-256 hash of its
+    query in ``extensions.persistedQuery.sha256Hash`` only and sends the full query along with the hash again, if the
+    server answers with ``PersistedQueryNotFound``. Registered queries are kept in Redis for
+    ``settings.PERSISTED_QUERY_TIMEOUT`` seconds if ``settings.REDIS_URL`` is configured, otherwise they are only
+    known while their document is cached. Persisted queries are resolved before the response cache is looked up, so
+    that requests sending the hash only are cached like requests sending the query.
+    """
+
+    # views are instantiated for every request, hence the backend and its document cache are shared by all of them
+    document_backend = CachedGraphQLBackend()
+
+    def __init__(self, backend=None, **kwargs):
+        super().__init__(backend=backend or self.document_backend, **kwargs)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        document_hash = self.get_persisted_query_hash(request, data)
+        if document_hash is None:
+            return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        if query:
+            if get_document_hash(query) != document_hash:
+                raise HttpError(HttpResponseBadRequest("provided sha does not match query"))
+            self.store_persisted_query(document_hash, query)
+        else:
+            query = self.load_persisted_query(request, document_hash)
+            if query is None:
+                return ExecutionResult(
+                    errors=[GraphQLError("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})]
+                )
+        return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+    @staticmethod
+    def get_persisted_query_hash(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if not extensions:
+            return None
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        persisted_query = extensions.get("persistedQuery") if isinstance(extensions, dict) else None
+        if not persisted_query:
+            return None
+        if persisted_query.get("version", 1) != 1 or not isinstance(persisted_query.get("sha256Hash"), str):
+            raise HttpError(HttpResponseBadRequest("Unsupported persisted query."))
+        return persisted_query["sha256Hash"].lower()
+
+    def load_persisted_query(self, request, document_hash):
+        document = self.get_backend(request).get_document(self.schema, document_hash)
+        if document is not None:
+            return document.document_string
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            query = redis.get(PERSISTED_QUERY_KEY_PREFIX + document_hash)
+        except RedisError as e:
+            logger.warning(f"Could not load persisted query from Redis: {e}")
+            return None
+        return query.decode() if query is not None else None
+
+    @staticmethod
+    def store_persisted_query(document_hash, query):
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            redis.set(PERSISTED_QUERY_KEY_PREFIX + document_hash, query, ex=settings.PERSISTED_QUERY_TIMEOUT)
+        except RedisError as e:
+            logger.warning(f"Could not store persisted query in Redis: {e}")
+
+
+class MeasuredGraphQLView(PersistedQueryGraphQLView):
+    """
+    GraphQL view measuring the duration and the SQL queries of every request by its operation.
+
+    Only the queries on the request thread are counted, resolvers running blocking I/O on the pool of the executor
+    use their own database connections.
+    """
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        operation = get_operation_label(operation_name)
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with connection.execute_wrapper(count_query):
+                result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+            if result is not None and not result.errors:
+                outcome = "success"
+            return result
+        finally:
+            graphql_request_seconds.labels(operation, outcome).observe(time.perf_counter() - start)
+            graphql_request_queries.labels(operation).observe(queries)
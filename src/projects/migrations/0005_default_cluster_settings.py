@@ -1,15 +1,23 @@
 # Generated by Django 2.2.23 on 2021-06-01 19:15
 
 from django.db import migrations
-
-from projects.models import Project
+from django.db.models import Max
 
 
 def forwards_func(apps, schema_editor):
-
-    for instance in Project.objects.all():
-        if not hasattr(instance, "cluster_settings"):
-            instance.add_cluster_settings()
+    # the historical models, the current ones have fields which are added by later migrations
+    Project = apps.get_model("projects", "Project")
+    ClusterSettings = apps.get_model("projects", "ClusterSettings")
+
+    for instance in Project.objects.filter(cluster_settings__isnull=True):
+        # like Project.add_cluster_settings, which is not available on historical models
+        highest_cluster_port = ClusterSettings.objects.filter(project__organization=instance.organization).aggregate(
+            Max("port")
+        )["port__max"]
+        if highest_cluster_port:
+            ClusterSettings.objects.create(port=highest_cluster_port + 1, project=instance)
+        else:
+            ClusterSettings.objects.create(project=instance)
 
 
 class Migration(migrations.Migration):
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.24 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0008_helm_overrides"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deck",
+            name="tree_hash",
+            field=models.TextField(blank=True, default=""),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="deck",
+            name="values_hash",
+            field=models.TextField(blank=True, default=""),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.24 on 2026-10-18 13:05
+
+import django.utils.timezone
+import django_extensions.db.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0009_deck_render_hashes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deck",
+            name="created",
+            field=django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="deck",
+            index=models.Index(fields=["created", "id"], name="projects_deck_created_id"),
+        ),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(fields=["created", "id"], name="projects_project_created_id"),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.24 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0010_keyset_pagination"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ManifestBlob",
+            fields=[
+                ("digest", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("data", models.BinaryField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="EnvironmentManifest",
+            fields=[
+                (
+                    "environment",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="manifest",
+                        serialize=False,
+                        to="projects.Environment",
+                        verbose_name="Environment",
+                    ),
+                ),
+                ("commit", models.TextField()),
+                ("values_hash", models.TextField()),
+                ("etag", models.TextField()),
+                (
+                    "blob",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="projects.ManifestBlob",
+                    ),
+                ),
+            ],
+        ),
+    ]
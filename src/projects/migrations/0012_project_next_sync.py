@@ -0,0 +1,23 @@
+# Generated by Django 2.2.24 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0011_environment_manifest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="next_sync",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="sync_failures",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
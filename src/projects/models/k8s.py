@@ -4,6 +4,7 @@ import uuid
 from django.contrib.postgres.fields import JSONField
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
+from django_extensions.db.fields import CreationDateTimeField
 from django_extensions.db.models import TitleDescriptionModel
 
 from projects.utils.model import NonUniqueSlugMixin
@@ -35,23 +36,41 @@ class Deck(TitleDescriptionModel, NonUniqueSlugMixin):
     # SHA-256 hash from title + type
     hash = models.TextField()
 
+    # git tree hash of dir_path and hash of the environments at the time the deck was rendered last
+    tree_hash = models.TextField(blank=True)
+    values_hash = models.TextField(blank=True)
+
+    created = CreationDateTimeField()
+
     def __str__(self):
         return f"{self.project.title}:{self.title}"
 
     class Meta:
         verbose_name = "Deck"
         verbose_name_plural = "Decks"
+        # keyset pagination
+        indexes = [models.Index(fields=["created", "id"], name="projects_deck_created_id")]
+
+    def update_environments(self, deck_data, environments=None):
+        """
+        Resets the values of environments whose values path is not part of the deck anymore.
 
-    def update_environments(self, deck_data):
+        Returns the changed environments, saving them is up to the caller.
+        """
         # TODO how to update deployments for multiple environments?
         # If deck is only updated we probably need to update the values of the environments.
-        for environment in self.environments.all():
-            if "information" in deck_data.file_information and all(
-                environment.values_path != file_info["path"] for file_info in deck_data.file_information["information"]
-            ):
+        if environments is None:
+            environments = self.environments.all()
+        if not deck_data.file_information or "information" not in deck_data.file_information:
+            return []
+        file_paths = {file_info["path"] for file_info in deck_data.file_information["information"]}
+        updated_environments = []
+        for environment in environments:
+            if environment.values_path and environment.values_path not in file_paths:
                 environment.values_path = ""
                 environment.value_schema = ""
-            environment.save()
+                updated_environments.append(environment)
+        return updated_environments
 
 
 class K8SDeployment(TitleDescriptionModel):
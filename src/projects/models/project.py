@@ -1,10 +1,12 @@
+import gzip
+import hashlib
 import logging
 import uuid
 from typing import Optional
 
 from commons.keycloak.abstract_models import KeycloakResource
-from django.db import models
-from django.db.models import QuerySet
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, QuerySet
 from django.db.models.aggregates import Max
 from django_extensions.db.fields import CreationDateTimeField
 from django_extensions.db.models import TitleDescriptionModel
@@ -64,12 +66,18 @@ class Project(TitleDescriptionModel, NonUniqueSlugMixin, KeycloakResource):
 
     organization = models.UUIDField(default=uuid.uuid4, editable=True)
 
+    # the next scheduled sync and the scheduled syncs failed in a row
+    next_sync = models.DateTimeField(blank=True, null=True, db_index=True)
+    sync_failures = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return f"Project: {self.title}"
 
     class Meta:
         verbose_name = "Project"
         verbose_name_plural = "Projects"
+        # keyset pagination
+        indexes = [models.Index(fields=["created", "id"], name="projects_project_created_id")]
 
     def save(self, *args, **kwargs):
         update_repo = kwargs.pop("update_repository", False)
@@ -77,17 +85,22 @@ class Project(TitleDescriptionModel, NonUniqueSlugMixin, KeycloakResource):
         if update_repo:
             self.update_repository()
 
-    def update_repository(self, updating_decks: QuerySet = None, render=False):
-        from projects.tasks import update_repository_information
+    def update_repository(self, updating_decks: QuerySet = None, render=False, priority: str = None):
+        from projects.utils.progress import publish_sync_progress
+        from projects.utils.sync import SyncPriority, request_sync
+        from projects.utils.versions import bump_project_version
 
         self.repository_status = RepositoryStatus.CLONING_PENDING
         self.save()
+        # cached responses show the pending status, although the sync may wait for a free slot
+        bump_project_version(self.pk)
+        publish_sync_progress(self.pk, status=self.repository_status)
+        priority = priority or SyncPriority.INTERACTIVE
         if updating_decks:
-            update_repository_information.delay(
-                self.pk, deck_ids=list(updating_decks.values_list("pk", flat=True)), render=render
-            )
+            deck_ids = list(updating_decks.values_list("pk", flat=True))
+            request_sync(self.pk, deck_ids=deck_ids, render=render, priority=priority)
         else:
-            update_repository_information.delay(self.pk, render=render)
+            request_sync(self.pk, render=render, priority=priority)
 
     def add_cluster_settings(self):
         """
@@ -161,14 +174,20 @@ class Environment(TitleDescriptionModel):
             self.deck.project.update_repository(updating_decks=updating_deck, render=True)
 
     @classmethod
-    def create_initial_environment(cls, deck):
-        return Environment.objects.create(
+    def get_initial_environment(cls, deck):
+        return Environment(
             title="auto-created environment",
             deck=deck,
             type=cls.TYPE_CHOICES[0][0],
             values_path="",
         )
 
+    @classmethod
+    def create_initial_environment(cls, deck):
+        environment = cls.get_initial_environment(deck)
+        environment.save()
+        return environment
+
 
 class ClusterSettings(models.Model):
     PROVIDER_CHOICES = (("k3d", "k3d"),)
@@ -190,3 +209,63 @@ class HelmOverrides(models.Model):
     overrides = models.TextField(
         verbose_name="overrides",
     )
+
+
+class ManifestBlob(models.Model):
+    """
+    A rendered manifest document, stored once for all environments rendering it.
+
+    Blobs are addressed by the SHA-256 digest of their content and count the environment manifests referencing them.
+    They are deleted as soon as no environment manifest references them anymore.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+
+    # gzip-compressed content
+    data = models.BinaryField()
+
+    ref_count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def acquire(cls, content: bytes) -> str:
+        """Adds a reference to the blob of the content, which is created if necessary, and returns its digest."""
+        digest = hashlib.sha256(content).hexdigest()
+        if cls.objects.filter(digest=digest).update(ref_count=F("ref_count") + 1):
+            return digest
+        try:
+            with transaction.atomic():
+                # a fixed mtime keeps the compressed content identical for identical content
+                cls.objects.create(digest=digest, data=gzip.compress(content, mtime=0), ref_count=1)
+        except IntegrityError:
+            # the blob was created concurrently
+            cls.objects.filter(digest=digest).update(ref_count=F("ref_count") + 1)
+        return digest
+
+    @classmethod
+    def release(cls, digest: str):
+        """Removes a reference to the blob and deletes the blob with its last reference."""
+        # the reference count never drops below zero, even if the blob is released concurrently
+        if cls.objects.filter(digest=digest, ref_count__gt=0).update(ref_count=F("ref_count") - 1):
+            cls.objects.filter(digest=digest, ref_count=0).delete()
+
+
+class EnvironmentManifest(models.Model):
+    """The manifests of an environment as rendered by the last update of its project, served by ``K8sSpecsView``."""
+
+    environment = models.OneToOneField(
+        verbose_name="Environment",
+        to="projects.Environment",
+        on_delete=models.CASCADE,
+        related_name="manifest",
+        primary_key=True,
+    )
+
+    # the commit and the values hash of the deck the manifests were rendered for
+    commit = models.TextField()
+    values_hash = models.TextField()
+
+    # strong ETag of the manifests, derived from the commit and the values hash
+    etag = models.TextField()
+
+    # JSON document of the manifests, released by the post_delete signal handler
+    blob = models.ForeignKey("projects.ManifestBlob", on_delete=models.PROTECT, related_name="+")
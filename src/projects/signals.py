@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from projects.models import EnvironmentManifest, ManifestBlob
+
+
+@receiver(post_delete, sender=EnvironmentManifest)
+def release_manifest_blob(sender, instance: EnvironmentManifest, **kwargs):
+    # also called for the manifests deleted along with their environments, decks and projects
+    ManifestBlob.release(instance.blob_id)
@@ -1,26 +1,86 @@
 import logging
 
+from django.conf import settings
+
 from configuration.celery import app
 from projects.models import Project, RepositoryStatus
+from projects.utils.progress import publish_sync_progress
 from projects.utils.project import ProjectUpdater
+from projects.utils.schedule import schedule_syncs
+from projects.utils.sync import (
+    SyncPostponed,
+    SyncPriority,
+    SyncRequest,
+    enqueue_sync,
+    get_postpone_delay,
+    park_sync,
+    project_sync,
+)
+from projects.utils.versions import bump_project_version
 
 logger = logging.getLogger("projects.celery")
 
 
 @app.task(bind=True, default_retry_delay=5, max_retries=3)
-def update_repository_information(self, project_id, deck_ids=None, render=False):
+def update_repository_information(
+    self, project_id, deck_ids=None, render=False, priority=SyncPriority.INTERACTIVE, coalesced=False, attempt=0
+):
+    organization = Project.objects.values_list("organization", flat=True).get(id=project_id)
+    try:
+        with project_sync(project_id, organization, priority, deck_ids, render, coalesced) as request:
+            if request is None:
+                logger.info(f"Requested sync of project {project_id} was performed already.")
+                return
+            _update_repository_information(project_id, request.deck_ids, request.render)
+    except SyncPostponed as e:
+        if attempt >= settings.SYNC_MAX_POSTPONES:
+            # the request stays pending for the next sync instead of occupying the queue
+            logger.warning(f"Giving up sync of project {project_id} after {attempt} attempts: {e}")
+            park_sync(project_id, priority, None if coalesced else SyncRequest(deck_ids, render))
+            return
+        # the sync stays queued until the running syncs are finished
+        logger.info(f"Postponing sync of project {project_id}: {e}")
+        enqueue_sync(
+            project_id,
+            priority,
+            countdown=get_postpone_delay(attempt),
+            deck_ids=deck_ids,
+            render=render,
+            coalesced=coalesced,
+            attempt=attempt + 1,
+        )
+
+
+@app.task
+def schedule_repository_syncs():
+    projects = schedule_syncs()
+    logger.info(f"Requested scheduled syncs of {len(projects)} projects.")
+
+
+def _update_repository_information(project_id, deck_ids, render):
     project = Project.objects.get(id=project_id)
-    project.current_commit = ""
-    project.current_commit_date_time = None
+    # requested decks and renderings are always updated, as their environments may have changed
+    if not deck_ids and not render and ProjectUpdater(project).is_up_to_date():
+        # environments may have changed without a change of the repository, only their decks are rendered again
+        deck_ids = ProjectUpdater(project).get_stale_deck_ids()
+        if not deck_ids:
+            logger.info(f"Repository of project {project.pk} is unchanged at {project.current_commit}.")
+            project.repository_status = RepositoryStatus.OK
+            project.save()
+            bump_project_version(project.pk, commit=project.current_commit)
+            publish_sync_progress(project.pk, status=project.repository_status, commit=project.current_commit)
+            return
+        render = True
     project.repository_status = RepositoryStatus.CLONING
     project.save()
+    publish_sync_progress(project.pk, status=project.repository_status)
+    bump_project_version(project.pk, commit=project.current_commit)
     if deck_ids:
-        decks = project.decks.filter(pk__in=deck_ids)
+        updater = ProjectUpdater(project, project.decks.filter(pk__in=deck_ids), render_charts=render)
+    elif render:
+        updater = ProjectUpdater(project, render_charts=True)
     else:
-        decks_with_env = project.decks.filter(environments__isnull=False)
-        if decks_with_env.exists():
-            updater = ProjectUpdater(project, decks_with_env, render_charts=True)
-            updater.update()
-        decks = None
-    updater = ProjectUpdater(project, decks, render_charts=render)
+        # decks with environments are always rendered, the repository is cloned and parsed once for all decks
+        decks_with_env = project.decks.filter(environments__isnull=False).values_list("pk", flat=True)
+        updater = ProjectUpdater(project, render_charts=True, render_deck_ids=list(decks_with_env))
     updater.update()
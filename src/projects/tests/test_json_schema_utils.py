@@ -1,8 +1,13 @@
 import json
+from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from projects.utils.value_schema import create_json_value_schema_from_file, create_json_value_schema_from_string
+from projects.utils.value_schema import (
+    create_json_value_schema_from_file,
+    create_json_value_schema_from_string,
+    value_schema_cache,
+)
 
 
 class JsonSchemaTest(TestCase):
@@ -172,3 +177,69 @@ class JsonSchemaTest(TestCase):
         properties = schema["properties"]
         self.assertTrue("test" in properties)
         self.assertTrue("$ref" in properties["test"])
+
+    def test_yaml_with_repeated_object_names(self):
+        yaml = """
+        web:
+            image:
+                tag: latest
+        worker:
+            image:
+                tag: 1
+        """
+
+        schema = json.loads(create_json_value_schema_from_string(yaml))["schema"]
+        definitions = schema["definitions"]
+        self.assertEqual(definitions["web"]["properties"]["image"], {"$ref": "#/definitions/image"})
+        self.assertEqual(definitions["worker"]["properties"]["image"], {"$ref": "#/definitions/image1"})
+        self.assertEqual(definitions["image"]["properties"]["tag"]["type"], "string")
+        self.assertEqual(definitions["image1"]["properties"]["tag"]["type"], "integer")
+
+    def test_yaml_with_schema_keys(self):
+        yaml = """
+        schema: 1
+        chart:
+            schema:
+                strict: true
+        checks:
+            schema: [values]
+        """
+
+        schema = json.loads(create_json_value_schema_from_string(yaml))["schema"]
+        definitions = schema["definitions"]
+        # objects and lists named "schema" are renamed like by the pydantic models of the previous implementation
+        self.assertEqual(schema["properties"]["schema"], {"title": "Schema", "type": "integer"})
+        self.assertEqual(definitions["chart"]["properties"]["schemaAlias"], {"$ref": "#/definitions/schemaAlias"})
+        self.assertEqual(definitions["schemaAlias"]["properties"]["strict"]["type"], "boolean")
+        self.assertEqual(
+            definitions["checks"]["properties"]["schemaAlias"],
+            {"title": "Schemaalias", "type": "array", "items": {"type": "string"}},
+        )
+
+
+class ValueSchemaCacheTest(TestCase):
+    def setUp(self):
+        value_schema_cache.clear()
+
+    def test_identical_values_share_schema(self):
+        with mock.patch(
+            "projects.utils.value_schema.create_json_value_schema_from_string",
+            side_effect=create_json_value_schema_from_string,
+        ) as create_schema:
+            schema = value_schema_cache.get_schema("key: value")
+            self.assertEqual(value_schema_cache.get_schema("key: value"), schema)
+            self.assertIsNone(value_schema_cache.get_schema("key"))
+            self.assertIsNone(value_schema_cache.get_schema("key"))
+        self.assertEqual(create_schema.call_count, 2)
+        self.assertEqual(schema, create_json_value_schema_from_string("key: value"))
+
+    @override_settings(VALUE_SCHEMA_CACHE_SIZE=1)
+    def test_least_recently_used_schema_is_evicted(self):
+        with mock.patch(
+            "projects.utils.value_schema.create_json_value_schema_from_string",
+            side_effect=create_json_value_schema_from_string,
+        ) as create_schema:
+            value_schema_cache.get_schema("key: 1")
+            value_schema_cache.get_schema("key: 2")
+            value_schema_cache.get_schema("key: 1")
+        self.assertEqual(create_schema.call_count, 3)
@@ -0,0 +1,92 @@
+import threading
+from unittest import mock
+
+import fakeredis
+from django.test import TestCase, override_settings
+
+from projects.utils.keycloak import GroupMembersCache
+
+
+class GroupMembersCacheTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch("projects.utils.keycloak.GroupHandler")
+        self.group_handler = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.group_handler.return_value.members.side_effect = lambda group_id: [{"id": f"{group_id}-user"}]
+
+    def test_members_are_cached(self):
+        cache = GroupMembersCache()
+        self.assertEqual(cache.get_members(["admins"]), {"admins": [{"id": "admins-user"}]})
+        self.assertEqual(cache.get_members(["admins"]), {"admins": [{"id": "admins-user"}]})
+        self.assertEqual(self.group_handler.return_value.members.call_count, 1)
+
+        cache.invalidate("admins")
+        cache.get_members(["admins"])
+        self.assertEqual(self.group_handler.return_value.members.call_count, 2)
+
+    @override_settings(GROUP_MEMBERS_CACHE_TIMEOUT=0)
+    def test_members_expire(self):
+        cache = GroupMembersCache()
+        cache.get_members(["admins"])
+        cache.get_members(["admins"])
+        self.assertEqual(self.group_handler.return_value.members.call_count, 2)
+
+    def test_missing_members_are_fetched_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def members(group_id):
+            # fails unless all groups are fetched at the same time
+            barrier.wait()
+            return []
+
+        self.group_handler.return_value.members.side_effect = members
+        self.assertEqual(GroupMembersCache().get_members(["a", "b", "c"]), {"a": [], "b": [], "c": []})
+
+    def test_errors_are_not_cached(self):
+        error = ConnectionError()
+        self.group_handler.return_value.members.side_effect = [error, []]
+        cache = GroupMembersCache()
+        self.assertEqual(cache.get_members(["admins"]), {"admins": error})
+        self.assertEqual(cache.get_members(["admins"]), {"admins": []})
+
+
+class SharedGroupMembersCacheTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch("projects.utils.keycloak.GroupHandler")
+        self.group_handler = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.group_handler.return_value.members.side_effect = lambda group_id: [{"id": f"{group_id}-user"}]
+        patcher = mock.patch("projects.utils.keycloak.get_redis", return_value=fakeredis.FakeStrictRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_members_are_shared_between_processes(self):
+        cache, other_cache = GroupMembersCache(), GroupMembersCache()
+        self.assertEqual(cache.get_members(["admins"]), {"admins": [{"id": "admins-user"}]})
+        self.assertEqual(other_cache.get_members(["admins"]), {"admins": [{"id": "admins-user"}]})
+        self.assertEqual(self.group_handler.return_value.members.call_count, 1)
+
+        # the invalidation of one process is seen by all processes
+        cache.invalidate("admins")
+        other_cache.get_members(["admins"])
+        self.assertEqual(self.group_handler.return_value.members.call_count, 2)
+
+    def test_members_fetched_before_invalidation_are_not_stored(self):
+        cache = GroupMembersCache()
+
+        def members(group_id):
+            cache.invalidate(group_id)
+            return []
+
+        self.group_handler.return_value.members.side_effect = members
+        cache.get_members(["admins"])
+        self.group_handler.return_value.members.side_effect = lambda group_id: []
+        cache.get_members(["admins"])
+        self.assertEqual(self.group_handler.return_value.members.call_count, 2)
+
+    @override_settings(GROUP_MEMBERS_CACHE_TIMEOUT=0)
+    def test_members_expire(self):
+        cache = GroupMembersCache()
+        cache.get_members(["admins"])
+        cache.get_members(["admins"])
+        self.assertEqual(self.group_handler.return_value.members.call_count, 2)
@@ -0,0 +1,139 @@
+from unittest import mock
+
+import fakeredis
+from django.test import TestCase, override_settings
+
+from projects.utils.sync import (
+    SyncPostponed,
+    SyncPriority,
+    SyncRequest,
+    enqueue_sync,
+    get_running_syncs,
+    park_sync,
+    project_sync,
+    request_sync,
+)
+
+
+class SyncCoalescingTest(TestCase):
+    project_id = "4f6ca6d4-7d5e-4a2e-9b1e-3e4d3c1f1a2b"
+
+    def setUp(self):
+        patcher = mock.patch("projects.utils.sync.get_redis", return_value=fakeredis.FakeStrictRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("projects.utils.sync.enqueue_sync")
+        self.enqueue_sync = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync(self, **kwargs):
+        with project_sync(self.project_id, "organization", **kwargs) as request:
+            return request
+
+    def test_requests_are_merged(self):
+        request_sync(self.project_id, deck_ids=["b"])
+        request_sync(self.project_id, deck_ids=["a", "b"], render=True)
+
+        self.enqueue_sync.assert_called_once_with(self.project_id, SyncPriority.INTERACTIVE, coalesced=True)
+        self.assertEqual(self.sync(coalesced=True), SyncRequest(["a", "b"], True))
+
+    def test_requests_of_all_decks_absorb_requested_decks(self):
+        request_sync(self.project_id, deck_ids=["a"])
+        request_sync(self.project_id)
+
+        # the requested deck is rendered, even if the repository is unchanged
+        self.assertEqual(self.sync(coalesced=True), SyncRequest(None, True))
+
+        request_sync(self.project_id)
+        self.assertEqual(self.sync(coalesced=True), SyncRequest(None, False))
+
+    def test_syncs_are_enqueued_once_per_priority(self):
+        request_sync(self.project_id)
+        request_sync(self.project_id)
+        request_sync(self.project_id, priority=SyncPriority.BATCH)
+        request_sync(self.project_id, priority=SyncPriority.BATCH)
+        self.assertEqual(
+            self.enqueue_sync.call_args_list,
+            [
+                mock.call(self.project_id, SyncPriority.INTERACTIVE, coalesced=True),
+                mock.call(self.project_id, SyncPriority.BATCH, coalesced=True),
+            ],
+        )
+
+        # requests following the start of the sync enqueue the next sync
+        self.sync(coalesced=True)
+        request_sync(self.project_id)
+        self.assertEqual(self.enqueue_sync.call_count, 3)
+
+    def test_performed_requests_are_skipped(self):
+        request_sync(self.project_id, render=True)
+        request_sync(self.project_id, priority=SyncPriority.BATCH)
+
+        self.assertEqual(self.sync(coalesced=True), SyncRequest(None, True))
+        # the batch sync finds the requests performed by the interactive sync
+        self.assertIsNone(self.sync(priority=SyncPriority.BATCH, coalesced=True))
+        # uncoalesced syncs perform their own request
+        self.assertEqual(self.sync(deck_ids=["a"]), SyncRequest(["a"], False))
+
+    def test_parked_requests_are_performed_by_the_next_sync(self):
+        request_sync(self.project_id, deck_ids=["a"])
+        park_sync(self.project_id, SyncPriority.INTERACTIVE)
+        park_sync(self.project_id, SyncPriority.INTERACTIVE, SyncRequest(["b"], True))
+
+        # the next request enqueues a sync again
+        request_sync(self.project_id, deck_ids=["c"])
+        self.assertEqual(self.enqueue_sync.call_count, 2)
+        self.assertEqual(self.sync(coalesced=True), SyncRequest(["a", "b", "c"], True))
+
+
+@override_settings(SYNC_CONCURRENCY=2, SYNC_ORGANIZATION_CONCURRENCY=1)
+class SyncSlotTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch("projects.utils.sync.get_redis", return_value=fakeredis.FakeStrictRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_syncs_are_limited(self):
+        with project_sync("project-1", "organization-1"):
+            with self.assertRaisesRegex(SyncPostponed, "Organization organization-1 has no free interactive"):
+                with project_sync("project-2", "organization-1"):
+                    pass
+            with project_sync("project-3", "organization-1", SyncPriority.BATCH):
+                self.assertEqual(get_running_syncs(), 2)
+                with self.assertRaisesRegex(SyncPostponed, "There is no free sync slot"):
+                    with project_sync("project-4", "organization-2"):
+                        pass
+            self.assertEqual(get_running_syncs(), 1)
+
+            with self.assertRaisesRegex(SyncPostponed, "Project project-1 is synced already"):
+                with project_sync("project-1", "organization-2"):
+                    pass
+            # the slot of the postponed sync is released
+            self.assertEqual(get_running_syncs(), 1)
+        self.assertEqual(get_running_syncs(), 0)
+
+    def test_slots_are_released_on_failure(self):
+        with self.assertRaises(ValueError):
+            with project_sync("project-1", "organization-1"):
+                raise ValueError()
+        self.assertEqual(get_running_syncs(), 0)
+
+        with project_sync("project-1", "organization-1") as request:
+            self.assertEqual(request, SyncRequest(None, False))
+
+
+class EnqueueSyncTest(TestCase):
+    def enqueue(self, priority):
+        with mock.patch("projects.tasks.update_repository_information.apply_async") as apply_async:
+            enqueue_sync("project-1", priority, countdown=10, coalesced=True)
+        return apply_async
+
+    def test_syncs_are_sent_to_the_default_queue(self):
+        self.enqueue(SyncPriority.INTERACTIVE).assert_called_once_with(
+            ("project-1",), {"coalesced": True, "priority": SyncPriority.INTERACTIVE}, queue=None, countdown=10
+        )
+
+    @override_settings(SYNC_INTERACTIVE_QUEUE="projects-interactive", SYNC_BATCH_QUEUE="projects-batch")
+    def test_syncs_are_routed_by_priority(self):
+        self.assertEqual(self.enqueue(SyncPriority.INTERACTIVE).call_args[1]["queue"], "projects-interactive")
+        self.assertEqual(self.enqueue(SyncPriority.BATCH).call_args[1]["queue"], "projects-batch")
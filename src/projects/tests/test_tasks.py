@@ -0,0 +1,209 @@
+from datetime import timedelta
+from unittest import mock
+
+from commons.keycloak.testing.driver import KeycloakDriver
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from environs import Env
+
+from projects.models import RepositoryStatus
+from projects.tasks import schedule_repository_syncs, update_repository_information
+from projects.tests.factories.environment import EnvironmentFactory
+from projects.tests.factories.helm_overrides import HelmOverridesFactory
+from projects.tests.factories.package import DeckFactory
+from projects.tests.factories.project import ProjectFactory
+from projects.utils.project import ProjectUpdater
+from projects.utils.sync import SyncPostponed, SyncPriority, SyncRequest
+
+
+class UpdateRepositoryInformationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        env = Env()
+        cls.driver = KeycloakDriver(
+            env.int("KEYCLOAK_PORT"),
+            env.str("KEYCLOAK_REALM_NAME"),
+            env.str("KEYCLOAK_CLIENT_ID"),
+            env.str("KEYCLOAK_CLIENT_SECRET"),
+        )
+        cls.driver.start()
+        cls.driver.create_realm()
+        cls.driver.create_realm_client()
+        super(UpdateRepositoryInformationTest, cls).setUpClass()
+
+    def test_unchanged_repository_is_not_parsed(self):
+        project = ProjectFactory.create(
+            spec_type="helm", spec_repository="https://github.com/Blueshoe/buzzword-charts", current_commit="abc"
+        )
+        with mock.patch("projects.utils.project.get_remote_head", return_value="abc"), mock.patch(
+            "projects.utils.project.HelmRepositoryParser"
+        ) as parser:
+            update_repository_information(project.pk)
+        parser.assert_not_called()
+        project.refresh_from_db()
+        self.assertEqual(project.repository_status, RepositoryStatus.OK)
+        self.assertEqual(project.current_commit, "abc")
+
+    def test_changed_repository_is_parsed(self):
+        project = ProjectFactory.create(
+            spec_type="helm", spec_repository="https://github.com/Blueshoe/buzzword-charts", current_commit="abc"
+        )
+        with mock.patch("projects.utils.project.get_remote_head", return_value="def"), mock.patch(
+            "projects.utils.project.HelmRepositoryParser"
+        ) as parser:
+            parser.return_value.deck_data = []
+            parser.return_value.repository_data.current_commit = "def"
+            parser.return_value.repository_data.current_commit_date_time = None
+            update_repository_information(project.pk)
+        parser.return_value.parse.assert_called()
+        project.refresh_from_db()
+        self.assertEqual(project.repository_status, RepositoryStatus.OK)
+        self.assertEqual(project.current_commit, "def")
+
+    def test_changed_environments_are_rendered_with_unchanged_repository(self):
+        project = ProjectFactory.create(
+            spec_type="helm", spec_repository="https://github.com/Blueshoe/buzzword-charts", current_commit="abc"
+        )
+        environment = EnvironmentFactory.create(deck=DeckFactory.create(project=project, hash="deck"))
+        unchanged = EnvironmentFactory.create(deck=DeckFactory.create(project=project, hash="unchanged"))
+        unchanged.deck.values_hash = ProjectUpdater.get_values_hash([unchanged])
+        unchanged.deck.save()
+        HelmOverridesFactory.create(environment=environment, overrides="replicas: 2")
+
+        self.assertEqual(ProjectUpdater(project).get_stale_deck_ids(), [environment.deck_id])
+        with mock.patch("projects.utils.project.get_remote_head", return_value="abc"), mock.patch.object(
+            ProjectUpdater, "update", autospec=True
+        ) as update:
+            update_repository_information(project.pk)
+        updater = update.call_args[0][0]
+        self.assertEqual(list(updater.updating_decks), [environment.deck])
+        self.assertTrue(updater.render_charts)
+
+    def test_requested_rendering_is_not_skipped(self):
+        project = ProjectFactory.create(
+            spec_type="helm", spec_repository="https://github.com/Blueshoe/buzzword-charts", current_commit="abc"
+        )
+        with mock.patch("projects.utils.project.get_remote_head", return_value="abc"), mock.patch(
+            "projects.utils.project.HelmRepositoryParser"
+        ) as parser:
+            parser.return_value.deck_data = []
+            parser.return_value.repository_data.current_commit = "abc"
+            parser.return_value.repository_data.current_commit_date_time = None
+            update_repository_information(project.pk, render=True)
+        parser.return_value.parse.assert_called_once()
+
+    def test_postponed_syncs_are_backed_off(self):
+        project = ProjectFactory.create()
+        with mock.patch("projects.tasks.project_sync", side_effect=SyncPostponed()), mock.patch(
+            "projects.tasks.enqueue_sync"
+        ) as enqueue_sync:
+            update_repository_information(project.pk, coalesced=True, attempt=2)
+        enqueue_sync.assert_called_once_with(
+            project.pk,
+            SyncPriority.INTERACTIVE,
+            countdown=mock.ANY,
+            deck_ids=None,
+            render=False,
+            coalesced=True,
+            attempt=3,
+        )
+        self.assertGreaterEqual(enqueue_sync.call_args[1]["countdown"], 40)
+        self.assertLessEqual(enqueue_sync.call_args[1]["countdown"], 44)
+
+    @override_settings(SYNC_MAX_POSTPONES=3)
+    def test_postponed_syncs_are_kept_pending(self):
+        project = ProjectFactory.create()
+        with mock.patch("projects.tasks.project_sync", side_effect=SyncPostponed()), mock.patch(
+            "projects.tasks.enqueue_sync"
+        ) as enqueue_sync, mock.patch("projects.tasks.park_sync") as park_sync:
+            update_repository_information(project.pk, coalesced=True, attempt=3)
+            update_repository_information(project.pk, ["a"], True, SyncPriority.BATCH, attempt=3)
+        enqueue_sync.assert_not_called()
+        self.assertEqual(
+            park_sync.call_args_list,
+            [
+                mock.call(project.pk, SyncPriority.INTERACTIVE, None),
+                mock.call(project.pk, SyncPriority.BATCH, SyncRequest(["a"], True)),
+            ],
+        )
+
+    def test_repository_is_parsed_once(self):
+        project = ProjectFactory.create(spec_type="helm", spec_repository="https://github.com/Blueshoe/buzzword-charts")
+        EnvironmentFactory.create(deck=DeckFactory.create(project=project, hash="deck"))
+        with mock.patch("projects.utils.project.HelmRepositoryParser") as parser:
+            parser.return_value.deck_data = []
+            parser.return_value.repository_data.current_commit = "def"
+            parser.return_value.repository_data.current_commit_date_time = None
+            update_repository_information(project.pk)
+        parser.return_value.parse.assert_called_once()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.driver.stop()
+
+
+class ScheduleRepositorySyncsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        env = Env()
+        cls.driver = KeycloakDriver(
+            env.int("KEYCLOAK_PORT"),
+            env.str("KEYCLOAK_REALM_NAME"),
+            env.str("KEYCLOAK_CLIENT_ID"),
+            env.str("KEYCLOAK_CLIENT_SECRET"),
+        )
+        cls.driver.start()
+        cls.driver.create_realm()
+        cls.driver.create_realm_client()
+        super(ScheduleRepositorySyncsTest, cls).setUpClass()
+
+    def schedule(self):
+        with mock.patch("projects.utils.schedule.request_sync") as request_sync:
+            schedule_repository_syncs()
+        return request_sync
+
+    def test_new_projects_are_scheduled_within_the_interval(self):
+        project = ProjectFactory.create(spec_type="helm", spec_repository="https://github.com/Blueshoe/buzzword-charts")
+
+        self.schedule().assert_not_called()
+        project.refresh_from_db()
+        self.assertLessEqual(project.next_sync, timezone.now() + timedelta(hours=1))
+
+    def test_due_projects_are_synced(self):
+        project = ProjectFactory.create(
+            spec_type="helm",
+            spec_repository="https://github.com/Blueshoe/buzzword-charts",
+            repository_status=RepositoryStatus.OK,
+            next_sync=timezone.now(),
+            sync_failures=2,
+        )
+        ProjectFactory.create(
+            spec_type="helm",
+            spec_repository="https://github.com/Blueshoe/buzzword-charts",
+            next_sync=timezone.now() + timedelta(minutes=5),
+        )
+
+        self.schedule().assert_called_once_with(project.pk, priority=SyncPriority.BATCH)
+        project.refresh_from_db()
+        self.assertEqual(project.sync_failures, 0)
+        self.assertGreater(project.next_sync, timezone.now() + timedelta(minutes=50))
+        self.assertLess(project.next_sync, timezone.now() + timedelta(minutes=70))
+
+    def test_failing_projects_are_backed_off(self):
+        project = ProjectFactory.create(
+            spec_type="helm",
+            spec_repository="https://github.com/Blueshoe/buzzword-charts",
+            repository_status=RepositoryStatus.AUTH_FAILED,
+            next_sync=timezone.now(),
+            sync_failures=2,
+        )
+
+        self.schedule().assert_called_once_with(project.pk, priority=SyncPriority.BATCH)
+        project.refresh_from_db()
+        self.assertEqual(project.sync_failures, 3)
+        self.assertGreater(project.next_sync, timezone.now() + timedelta(hours=7))
+        self.assertLess(project.next_sync, timezone.now() + timedelta(hours=9))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.driver.stop()
@@ -0,0 +1,167 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from commons.keycloak.testing.driver import KeycloakDriver
+from django.test import TestCase, override_settings
+from environs import Env
+
+from projects.models import Deck, Environment, K8SDeployment, ManifestBlob
+from projects.tests.factories.environment import EnvironmentFactory
+from projects.tests.factories.package import DeckFactory
+from projects.tests.factories.project import ProjectFactory
+from projects.utils.project import ProjectUpdater
+
+DEPLOYMENT = """
+kind: Deployment
+metadata:
+  name: {name}
+spec:
+  template:
+    spec:
+      containers:
+        - ports:
+            - containerPort: {port}
+"""
+
+
+def get_render_environment(*deployments):
+    specs_data = [
+        SimpleNamespace(kind="Deployment", name=name, content=DEPLOYMENT.format(name=name, port=port))
+        for name, port in deployments
+    ]
+    return SimpleNamespace(specs_data=specs_data)
+
+
+def get_deck_data(deck_hash, title, paths=()):
+    return SimpleNamespace(
+        hash=deck_hash,
+        title=title,
+        description="",
+        dir_path=title,
+        type="helm",
+        file_information={"information": [{"path": path, "encrypted": False} for path in paths]},
+        environments=[],
+        tree_hash=None,
+    )
+
+
+class ProjectUpdaterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        env = Env()
+        cls.driver = KeycloakDriver(
+            env.int("KEYCLOAK_PORT"),
+            env.str("KEYCLOAK_REALM_NAME"),
+            env.str("KEYCLOAK_CLIENT_ID"),
+            env.str("KEYCLOAK_CLIENT_SECRET"),
+        )
+        cls.driver.start()
+        cls.driver.create_realm()
+        cls.driver.create_realm_client()
+        super(ProjectUpdaterTest, cls).setUpClass()
+
+    def test_enrich_decks_data(self):
+        project = ProjectFactory.create()
+        stale_deck = DeckFactory.create(project=project, hash="stale", title="stale")
+        deck = DeckFactory.create(project=project, hash="existing", title="old title")
+        environment = EnvironmentFactory.create(deck=deck, type="local", values_path="removed.yaml")
+
+        decks_data = ProjectUpdater(project).enrich_decks_data(
+            [get_deck_data("existing", "new title", paths=["values.yaml"]), get_deck_data("created", "created")],
+            delete_stale=True,
+        )
+
+        self.assertFalse(Deck.objects.filter(pk=stale_deck.pk).exists())
+        deck.refresh_from_db()
+        self.assertEqual(deck.title, "new title")
+        environment.refresh_from_db()
+        self.assertEqual(environment.values_path, "")
+        created_deck = Deck.objects.get(project=project, hash="created")
+        self.assertEqual(Environment.objects.filter(deck=created_deck).count(), 1)
+        self.assertEqual([len(deck_data.environments) for deck_data in decks_data], [1, 1])
+        self.assertTrue(all(deck_data.requires_render for deck_data in decks_data))
+
+    def test_enrich_decks_data_queries(self):
+        project = ProjectFactory.create()
+        for i in range(10):
+            EnvironmentFactory.create(deck=DeckFactory.create(project=project, hash=str(i), title=str(i)))
+        # ten existing and ten new decks
+        decks_data = [get_deck_data(str(i), f"Deck {i}") for i in range(20)]
+
+        # load decks, create and update decks, load environments, create environments and the surrounding savepoint
+        with self.assertNumQueries(7):
+            ProjectUpdater(project).enrich_decks_data(decks_data)
+
+    def test_update_deployments(self):
+        environment = EnvironmentFactory.create()
+        updater = ProjectUpdater(environment.deck.project)
+
+        updater._update_deployments(environment, get_render_environment(("web", 8000), ("worker", 8001)))
+        web = K8SDeployment.objects.get(environment=environment, title="web")
+        worker = K8SDeployment.objects.get(environment=environment, title="worker")
+
+        updater._update_deployments(environment, get_render_environment(("web", 8000), ("worker", 9000), ("db", 5432)))
+        self.assertEqual(
+            {(deployment.pk, deployment.title, deployment.ports) for deployment in environment.deployments.all()},
+            {
+                (web.pk, "web", "8000"),
+                (worker.pk, "worker", "9000"),
+                (K8SDeployment.objects.get(environment=environment, title="db").pk, "db", "5432"),
+            },
+        )
+
+        updater._update_deployments(environment, get_render_environment(("web", 8000)))
+        self.assertEqual(list(environment.deployments.values_list("pk", flat=True)), [web.pk])
+
+    def test_update_manifest(self):
+        local = EnvironmentFactory.create(type="local")
+        remote = EnvironmentFactory.create(deck=local.deck, type="remote")
+        other = EnvironmentFactory.create()
+        updater = ProjectUpdater(local.deck.project)
+        deck_data = SimpleNamespace(values_hash="values")
+
+        # identical manifests are stored once
+        for environment in (local, remote, other):
+            updater._update_manifest(environment, get_render_environment(("web", 8000)), deck_data)
+        self.assertEqual(list(ManifestBlob.objects.values_list("ref_count", flat=True)), [3])
+
+        updater._update_manifest(other, get_render_environment(("web", 9000)), deck_data)
+        self.assertEqual(sorted(ManifestBlob.objects.values_list("ref_count", flat=True)), [1, 2])
+
+        # blobs are deleted along with their last reference
+        local.deck.delete()
+        self.assertEqual(list(ManifestBlob.objects.values_list("ref_count", flat=True)), [1])
+        updater._update_manifest(other, get_render_environment(("web", 8000)), deck_data)
+        self.assertEqual(list(ManifestBlob.objects.values_list("digest", flat=True)), [other.manifest.blob_id])
+
+    def test_release_manifest_blob(self):
+        digest = ManifestBlob.acquire(b"{}")
+        self.assertEqual(ManifestBlob.acquire(b"{}"), digest)
+
+        ManifestBlob.release(digest)
+        self.assertEqual(ManifestBlob.objects.get(pk=digest).ref_count, 1)
+        ManifestBlob.release(digest)
+        self.assertFalse(ManifestBlob.objects.filter(pk=digest).exists())
+        # releasing a deleted blob is a no-op
+        ManifestBlob.release(digest)
+        self.assertFalse(ManifestBlob.objects.exists())
+
+    @override_settings(RENDER_WORKERS=3, RENDER_TIMEOUT=1)
+    def test_render(self):
+        def render(*render_list):
+            deck, _ = render_list[0]
+            if deck.id == "slow":
+                time.sleep(3)
+            elif deck.id == "broken":
+                raise ValueError
+            return list(render_list)
+
+        parser = mock.Mock(render=mock.Mock(side_effect=render))
+        decks = [SimpleNamespace(id=deck_id, environments=["local"]) for deck_id in ("slow", "broken", "fast")]
+        results = {deck.id: rendered for deck, rendered in ProjectUpdater(None)._render(parser, decks)}
+        self.assertEqual(results, {"slow": None, "broken": None, "fast": [(decks[2], "local")]})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.driver.stop()
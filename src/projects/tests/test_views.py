@@ -0,0 +1,272 @@
+import gzip
+import hashlib
+import hmac
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from commons.keycloak.testing.driver import KeycloakDriver
+from django.test import RequestFactory, TestCase, override_settings
+from environs import Env
+
+from projects.models import ManifestBlob, RepositoryStatus
+from projects.tests.factories.environment import EnvironmentFactory
+from projects.tests.factories.package import DeckFactory
+from projects.tests.factories.project import ProjectFactory
+from projects.tests.test_updater import get_render_environment
+from projects.utils.metrics import TimedPhase, observe_phase
+from projects.utils.progress import SyncProgress
+from projects.utils.project import ProjectUpdater
+from projects.utils.sync import SyncPriority
+from projects.views import K8sSpecsView, MetricsView, RepositoryWebhookView, SyncProgressView
+
+
+class K8sSpecsViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        env = Env()
+        cls.driver = KeycloakDriver(
+            env.int("KEYCLOAK_PORT"),
+            env.str("KEYCLOAK_REALM_NAME"),
+            env.str("KEYCLOAK_CLIENT_ID"),
+            env.str("KEYCLOAK_CLIENT_SECRET"),
+        )
+        cls.driver.start()
+        cls.driver.create_realm()
+        cls.driver.create_realm_client()
+        super(K8sSpecsViewTest, cls).setUpClass()
+
+    def setUp(self):
+        self.environment = EnvironmentFactory.create()
+        project = self.environment.deck.project
+        project.current_commit = "abc"
+        ProjectUpdater(project)._update_manifest(
+            self.environment, get_render_environment(("web", 8000)), SimpleNamespace(values_hash="values")
+        )
+
+    def get(self, projects=None, **headers):
+        request = RequestFactory().get(f"/manifests/{self.environment.pk}", **headers)
+        if projects is None:
+            projects = [self.environment.deck.project_id]
+        request.permissions = mock.Mock(get_resource_id_by_scope=mock.Mock(return_value=projects))
+        return K8sSpecsView.as_view()(request, environment_uuid=self.environment.pk)
+
+    def test_manifests_are_streamed_compressed(self):
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        specs = json.loads(gzip.decompress(b"".join(response.streaming_content)))["specs"]
+        self.assertEqual([spec["sourceName"] for spec in specs], ["web"])
+
+        # revalidation with the ETag of the response
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_manifests_are_decompressed(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        specs = json.loads(b"".join(response.streaming_content))["specs"]
+        self.assertEqual([spec["sourceName"] for spec in specs], ["web"])
+        self.assertNotEqual(response["ETag"], self.get(HTTP_ACCEPT_ENCODING="gzip")["ETag"])
+
+    def test_manifests_are_streamed_in_chunks(self):
+        with mock.patch.object(K8sSpecsView, "chunk_size", 16):
+            chunks = list(self.get(HTTP_ACCEPT_ENCODING="gzip").streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 16 for chunk in chunks))
+        self.assertEqual(b"".join(chunks), ManifestBlob.objects.get().data)
+
+    def test_etag_changes_with_commit(self):
+        etag = self.get(HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        project = self.environment.deck.project
+        project.current_commit = "def"
+        ProjectUpdater(project)._update_manifest(
+            self.environment, get_render_environment(("web", 8000)), SimpleNamespace(values_hash="values")
+        )
+
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_manifests_of_other_projects_are_forbidden(self):
+        self.assertEqual(self.get(projects=[]).status_code, 403)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.driver.stop()
+
+
+class RepositoryWebhookViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        env = Env()
+        cls.driver = KeycloakDriver(
+            env.int("KEYCLOAK_PORT"),
+            env.str("KEYCLOAK_REALM_NAME"),
+            env.str("KEYCLOAK_CLIENT_ID"),
+            env.str("KEYCLOAK_CLIENT_SECRET"),
+        )
+        cls.driver.start()
+        cls.driver.create_realm()
+        cls.driver.create_realm_client()
+        super(RepositoryWebhookViewTest, cls).setUpClass()
+
+    def setUp(self):
+        self.project = ProjectFactory.create(spec_repository="https://github.com/unikubehq/Demo.git")
+        self.web = DeckFactory.create(project=self.project, dir_path="./web")
+        self.api = DeckFactory.create(project=self.project, dir_path="api/")
+        ProjectFactory.create(spec_repository="https://github.com/unikubehq/demo", spec_repository_branch="develop")
+        ProjectFactory.create(spec_repository="https://github.com/unikubehq/demo-other")
+
+    def push(self, paths=None, secret="webhook-secret", **payload):
+        payload = dict(
+            {
+                "ref": "refs/heads/main",
+                "repository": {
+                    "clone_url": "https://github.com/unikubehq/demo.git",
+                    "ssh_url": "git@github.com:unikubehq/demo.git",
+                    "default_branch": "main",
+                },
+                "commits": [{"added": [], "removed": [], "modified": paths or []}],
+            },
+            **payload,
+        )
+        body = json.dumps(payload).encode()
+        signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        request = RequestFactory().post(
+            "/webhooks/push",
+            body,
+            content_type="application/json",
+            HTTP_X_GITHUB_EVENT="push",
+            HTTP_X_HUB_SIGNATURE_256=signature,
+        )
+        with mock.patch("projects.utils.sync.request_sync") as request_sync:
+            response = RepositoryWebhookView.as_view()(request)
+        return response, request_sync
+
+    def test_affected_decks_are_synced(self):
+        response, request_sync = self.push(paths=["web/values.yaml", "web/templates/service.yaml"])
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(json.loads(response.content)["projects"], [str(self.project.pk)])
+        request_sync.assert_called_once_with(
+            self.project.pk, deck_ids=[self.web.pk], render=True, priority=SyncPriority.BATCH
+        )
+
+    def test_unknown_paths_sync_all_decks(self):
+        _, request_sync = self.push(paths=["web/values.yaml", "README.md"])
+        request_sync.assert_called_once_with(self.project.pk, render=True, priority=SyncPriority.BATCH)
+
+        # the changed paths of forced pushes are not known completely
+        _, request_sync = self.push(paths=["web/values.yaml"], forced=True)
+        request_sync.assert_called_once_with(self.project.pk, render=True, priority=SyncPriority.BATCH)
+
+    def test_synced_projects_are_marked_as_changed(self):
+        with mock.patch("projects.utils.versions.bump_project_version") as bump_project_version:
+            self.push(paths=["web/values.yaml"])
+
+        bump_project_version.assert_called_once_with(self.project.pk)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.repository_status, RepositoryStatus.CLONING_PENDING)
+
+    def test_other_branches_are_skipped(self):
+        response, request_sync = self.push(paths=["web/values.yaml"], ref="refs/heads/feature")
+
+        self.assertEqual(json.loads(response.content)["projects"], [])
+        request_sync.assert_not_called()
+
+    def test_invalid_signature_is_forbidden(self):
+        response, request_sync = self.push(paths=["web/values.yaml"], secret="other")
+
+        self.assertEqual(response.status_code, 403)
+        request_sync.assert_not_called()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.driver.stop()
+
+
+class SyncProgressViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        env = Env()
+        cls.driver = KeycloakDriver(
+            env.int("KEYCLOAK_PORT"),
+            env.str("KEYCLOAK_REALM_NAME"),
+            env.str("KEYCLOAK_CLIENT_ID"),
+            env.str("KEYCLOAK_CLIENT_SECRET"),
+        )
+        cls.driver.start()
+        cls.driver.create_realm()
+        cls.driver.create_realm_client()
+        super(SyncProgressViewTest, cls).setUpClass()
+
+    def setUp(self):
+        self.project = ProjectFactory.create(repository_status=RepositoryStatus.CLONING, current_commit="abc")
+
+    def get(self, projects=None, **params):
+        request = RequestFactory().get(f"/projects/{self.project.pk}/sync-progress", params)
+        if projects is None:
+            projects = [self.project.pk]
+        request.permissions = mock.Mock(get_resource_id_by_scope=mock.Mock(return_value=projects))
+        return SyncProgressView.as_view()(request, project_uuid=self.project.pk)
+
+    def test_events_follow_the_cursor(self):
+        events = [{"id": "2-0", "phase": "rendering", "current": "1", "total": "2"}]
+        progress = SyncProgress(events, "2-0", RepositoryStatus.CLONING_SUCCESSFUL, "def")
+        with mock.patch("projects.views.read_sync_progress", return_value=progress) as read_sync_progress:
+            # the status is read along with the events
+            with self.assertNumQueries(0):
+                response = self.get(after="1-0")
+
+        read_sync_progress.assert_called_once_with(self.project.pk, "1-0")
+        self.assertEqual(
+            json.loads(response.content),
+            {"repositoryStatus": "cloning-successful", "currentCommit": "def", "events": events, "cursor": "2-0"},
+        )
+
+    def test_unknown_status_is_loaded(self):
+        progress = SyncProgress([], "0-0", None, None)
+        with mock.patch("projects.views.read_sync_progress", return_value=progress):
+            response = json.loads(self.get().content)
+
+        self.assertEqual(response["repositoryStatus"], RepositoryStatus.CLONING)
+        self.assertEqual(response["currentCommit"], "abc")
+
+    def test_status_is_returned_without_events(self):
+        response = json.loads(self.get().content)
+
+        self.assertEqual(response["repositoryStatus"], RepositoryStatus.CLONING)
+        self.assertEqual(response["events"], [])
+        self.assertIsNone(response["cursor"])
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.get(projects=[]).status_code, 403)
+        self.assertEqual(self.get(after="latest").status_code, 400)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.driver.stop()
+
+
+class MetricsViewTest(TestCase):
+    def get(self, **headers):
+        return MetricsView.as_view()(RequestFactory().get("/metrics", **headers))
+
+    def test_metrics_are_exposed(self):
+        with self.assertRaises(ValueError), observe_phase(TimedPhase.PARSE):
+            raise ValueError()
+
+        response = self.get(HTTP_AUTHORIZATION="Bearer metrics-token")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'projects_sync_phase_seconds_count{outcome="failure",phase="parse"}', response.content)
+
+    def test_scrapers_must_authenticate(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer other-token").status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer ").status_code, 403)
@@ -0,0 +1,148 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
+
+from commons.keycloak.groups import GroupHandler
+from django.conf import settings
+from redis import RedisError
+
+from projects.utils.redis import get_redis
+
+logger = logging.getLogger("projects.keycloak")
+
+# stores members only if the group was not invalidated since they were fetched
+STORE_MEMBERS = """
+if (redis.call("GET", KEYS[2]) or "") == ARGV[1] then
+    redis.call("SET", KEYS[1], ARGV[2], "EX", ARGV[3])
+end
+"""
+# seconds the generation of an invalidated group is kept, which exceeds the duration of any fetch of its members
+GENERATION_TTL = 60 * 60
+
+
+class GroupMembersCache:
+    """
+    Members of Keycloak groups, cached for ``settings.GROUP_MEMBERS_CACHE_TIMEOUT`` seconds.
+
+    If ``settings.REDIS_URL`` is configured, the members are cached in Redis and shared by all processes, so that an
+    invalidation is seen by every process at once. Otherwise the cache is shared by all requests of the process and
+    holds the members of at most ``settings.GROUP_MEMBERS_CACHE_SIZE`` groups. Groups which are not cached are fetched
+    concurrently.
+    """
+
+    key_prefix = "projects:group-members:"
+
+    def __init__(self):
+        self._members = OrderedDict()
+        self._lock = threading.Lock()
+        # incremented on invalidation, so that members fetched before are not cached afterwards
+        self._version = 0
+
+    def get_members(self, group_ids: List[str]) -> Dict[str, Union[List[dict], Exception]]:
+        """Returns the members of every group, or the exception raised while fetching them."""
+        group_ids = list(dict.fromkeys(group_ids))
+        redis = get_redis()
+        if redis is not None:
+            return self._get_shared_members(redis, group_ids)
+
+        members = {}
+        now = time.monotonic()
+        with self._lock:
+            version = self._version
+            for group_id in group_ids:
+                entry = self._members.get(group_id)
+                if entry is not None and entry[0] > now:
+                    self._members.move_to_end(group_id)
+                    members[group_id] = entry[1]
+        missing = [group_id for group_id in group_ids if group_id not in members]
+        if not missing:
+            return members
+
+        fetched = self._fetch(missing)
+        expires = time.monotonic() + settings.GROUP_MEMBERS_CACHE_TIMEOUT
+        with self._lock:
+            for group_id, group_members in fetched.items():
+                if isinstance(group_members, Exception) or version != self._version:
+                    continue
+                self._members[group_id] = (expires, group_members)
+                self._members.move_to_end(group_id)
+            while len(self._members) > settings.GROUP_MEMBERS_CACHE_SIZE:
+                self._members.popitem(last=False)
+        members.update(fetched)
+        return members
+
+    def invalidate(self, *group_ids: str):
+        with self._lock:
+            self._version += 1
+            for group_id in group_ids:
+                self._members.pop(group_id, None)
+        redis = get_redis()
+        if redis is None or not group_ids:
+            return
+        try:
+            with redis.pipeline() as pipeline:
+                for group_id in group_ids:
+                    pipeline.delete(f"{self.key_prefix}{group_id}")
+                    pipeline.incr(f"{self.key_prefix}{group_id}:generation")
+                    pipeline.expire(f"{self.key_prefix}{group_id}:generation", GENERATION_TTL)
+                pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Could not invalidate members of groups {group_ids}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._members.clear()
+
+    def _get_shared_members(self, redis, group_ids: List[str]) -> Dict[str, Union[List[dict], Exception]]:
+        keys = [f"{self.key_prefix}{group_id}" for group_id in group_ids]
+        try:
+            with redis.pipeline(transaction=False) as pipeline:
+                pipeline.mget(keys)
+                pipeline.mget([f"{key}:generation" for key in keys])
+                cached, generations = pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Could not load group members from Redis: {e}")
+            return self._fetch(group_ids)
+
+        members = {group_id: json.loads(data) for group_id, data in zip(group_ids, cached) if data is not None}
+        missing = {
+            group_id: (key, generation)
+            for group_id, key, generation in zip(group_ids, keys, generations)
+            if group_id not in members
+        }
+        if not missing:
+            return members
+
+        fetched = self._fetch(list(missing))
+        store = redis.register_script(STORE_MEMBERS)
+        try:
+            for group_id, group_members in fetched.items():
+                if isinstance(group_members, Exception) or settings.GROUP_MEMBERS_CACHE_TIMEOUT <= 0:
+                    continue
+                key, generation = missing[group_id]
+                store(
+                    keys=[key, f"{key}:generation"],
+                    args=[generation or b"", json.dumps(group_members), settings.GROUP_MEMBERS_CACHE_TIMEOUT],
+                )
+        except RedisError as e:
+            logger.warning(f"Could not store group members in Redis: {e}")
+        members.update(fetched)
+        return members
+
+    @staticmethod
+    def _fetch(group_ids: List[str]) -> Dict[str, Union[List[dict], Exception]]:
+        def fetch(group_id):
+            try:
+                return GroupHandler().members(group_id)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(len(group_ids), settings.KEYCLOAK_WORKERS)) as executor:
+            return dict(zip(group_ids, executor.map(fetch, group_ids)))
+
+
+group_members_cache = GroupMembersCache()
@@ -0,0 +1,87 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+
+# seconds of the phases of a sync, which take up to several minutes for large repositories
+SYNC_PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+sync_phase_seconds = Histogram(
+    "projects_sync_phase_seconds",
+    "Duration of the phases of repository syncs.",
+    ["phase", "outcome"],
+    buckets=SYNC_PHASE_BUCKETS,
+)
+synced_decks = Counter("projects_sync_decks", "Decks reconciled with their repository.")
+rendered_environments = Counter("projects_sync_rendered_environments", "Environments rendered.", ["outcome"])
+rendered_bytes = Counter("projects_sync_rendered_bytes", "Bytes of rendered manifests.")
+
+graphql_request_seconds = Histogram("gql_request_seconds", "Duration of GraphQL requests.", ["operation", "outcome"])
+graphql_request_queries = Histogram(
+    "gql_request_queries",
+    "SQL queries of GraphQL requests on the request thread.",
+    ["operation"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+OPERATION_NAME = re.compile(r"^[_A-Za-z][_0-9A-Za-z]{0,63}$")
+_operations = set()
+_operations_lock = threading.Lock()
+
+
+class TimedPhase:
+    CLONE = "clone"
+    PARSE = "parse"
+    ENRICH = "enrich"
+    RENDER = "render"
+    UPDATE_DEPLOYMENTS = "update_deployments"
+    VALUE_SCHEMA = "value_schema"
+
+
+@contextmanager
+def observe_phase(phase: str):
+    """Observes the duration of a phase of a sync, the outcome is a failure if the phase raises an exception."""
+    start = time.perf_counter()
+    outcome = "failure"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        sync_phase_seconds.labels(phase, outcome).observe(time.perf_counter() - start)
+
+
+def get_operation_label(operation_name: str = None) -> str:
+    """
+    Returns the label of a GraphQL operation.
+
+    Operation names are chosen by clients, only the first ``settings.GRAPHQL_METRICS_OPERATIONS`` names are labelled
+    by name, so that clients cannot create an unbounded number of time series.
+    """
+    if not operation_name:
+        return "anonymous"
+    if not OPERATION_NAME.match(operation_name):
+        return "other"
+    with _operations_lock:
+        if operation_name not in _operations:
+            if len(_operations) >= settings.GRAPHQL_METRICS_OPERATIONS:
+                return "other"
+            _operations.add(operation_name)
+    return operation_name
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Returns the registry of the metrics to expose.
+
+    If ``PROMETHEUS_MULTIPROC_DIR`` is set, the metrics of all processes sharing the directory are collected, e.g. of
+    the pool processes of a Celery worker.
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
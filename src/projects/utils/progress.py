@@ -0,0 +1,108 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+from redis import RedisError
+
+from projects.utils.redis import get_redis
+
+logger = logging.getLogger("projects.progress")
+
+PROGRESS_KEY_PREFIX = "projects:progress:"
+# seconds the events of a project are kept after its last event
+PROGRESS_TTL = 24 * 60 * 60
+# the first event of a stream
+FIRST_CURSOR = "0-0"
+
+
+class SyncProgress(NamedTuple):
+    events: List[Dict]
+    # the cursor of the last event
+    cursor: str
+    # the current repository status and commit of the project, None if they are unknown
+    status: Optional[str]
+    commit: Optional[str]
+
+
+class SyncPhase:
+    CLONING = "cloning"
+    PARSING = "parsing"
+    RENDERING = "rendering"
+
+
+def publish_sync_progress(
+    project_id,
+    status: str = None,
+    phase: str = None,
+    current: int = None,
+    total: int = None,
+    deck_id=None,
+    commit: str = None,
+):
+    """
+    Publishes a repository status transition or the progress of a phase of the sync of the project.
+
+    The events of a project are appended to a capped Redis stream, from which clients read the events following their
+    cursor (see ``read_sync_progress``). The latest status and commit are kept along with the stream, status
+    transitions without commit keep the commit. Like the project version, events are published once the current
+    transaction is committed.
+    """
+    redis = get_redis()
+    if redis is None:
+        return
+    fields = {"status": status, "phase": phase, "current": current, "total": total, "deck": deck_id, "commit": commit}
+    fields = {name: str(value) for name, value in fields.items() if value is not None}
+
+    def publish():
+        key = f"{PROGRESS_KEY_PREFIX}{project_id}"
+        try:
+            with redis.pipeline() as pipeline:
+                pipeline.xadd(key, fields, maxlen=settings.SYNC_PROGRESS_EVENTS, approximate=True)
+                pipeline.expire(key, PROGRESS_TTL)
+                if status is not None:
+                    state = {name: value for name, value in fields.items() if name in ("status", "commit")}
+                    pipeline.hset(f"{key}:status", mapping=state)
+                    pipeline.expire(f"{key}:status", PROGRESS_TTL)
+                pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Could not publish sync progress of project {project_id}: {e}")
+
+    transaction.on_commit(publish)
+
+
+def _decode(events) -> List[Dict]:
+    return [
+        dict({name.decode(): value.decode() for name, value in fields.items()}, id=event_id.decode())
+        for event_id, fields in events
+    ]
+
+
+def read_sync_progress(project_id, cursor: str = None) -> Optional[SyncProgress]:
+    """
+    Returns the events of the project following the cursor along with the current status of the project.
+
+    Without cursor only the latest event is returned. Never waits for events. Returns None, if the events are not
+    available.
+    """
+    redis = get_redis()
+    if redis is None:
+        return None
+    key = f"{PROGRESS_KEY_PREFIX}{project_id}"
+    try:
+        with redis.pipeline(transaction=False) as pipeline:
+            if cursor is None:
+                pipeline.xrevrange(key, count=1)
+            else:
+                pipeline.xread({key: cursor}, count=settings.SYNC_PROGRESS_EVENTS)
+            pipeline.hmget(f"{key}:status", "status", "commit")
+            events, state = pipeline.execute()
+    except RedisError as e:
+        logger.warning(f"Could not read sync progress of project {project_id}: {e}")
+        return None
+    if cursor is not None:
+        events = events[0][1] if events else []
+    events = _decode(events)
+    cursor = events[-1]["id"] if events else cursor or FIRST_CURSOR
+    status, commit = (value if value is None else value.decode() for value in state)
+    return SyncProgress(events, cursor, status, commit)
@@ -1,24 +1,44 @@
+import hashlib
+import json
 import logging
-from typing import List
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import yaml
 from commons.helm.data_classes import DeckData, RenderEnvironment
 from commons.helm.exceptions import RepositoryAuthenticationFailed, RepositoryBranchUnavailable, RepositoryCloningFailed
 from commons.helm.parser import HelmRepositoryParser
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.db.models import QuerySet
 
-from projects.models import Environment, K8SDeployment, RepositoryStatus
-from projects.utils.value_schema import create_json_value_schema_from_string
+from projects.models import Deck, Environment, EnvironmentManifest, K8SDeployment, ManifestBlob, RepositoryStatus
+from projects.utils.metrics import TimedPhase, observe_phase, rendered_bytes, rendered_environments, synced_decks
+from projects.utils.progress import SyncPhase, publish_sync_progress
+from projects.utils.repository import RepositoryCache, get_remote_head, get_tree_hash
+from projects.utils.value_schema import value_schema_cache
+from projects.utils.versions import bump_project_version
 
 logger = logging.getLogger("projects.updater")
 
 
 class ProjectUpdater:
-    def __init__(self, project, decks: QuerySet = None, render_charts=False):
+    """
+    Clones and parses the repository of the project once, reconciles its decks and renders their environments.
+
+    Only the given decks are updated, all decks by default. With ``render_charts`` the environments of updated decks
+    are rendered, if their chart directory or values changed since their last rendering, ``render_deck_ids`` limits
+    rendering to these decks.
+    """
+
+    def __init__(self, project, decks: QuerySet = None, render_charts=False, render_deck_ids: Iterable = None):
         self.project = project
         self.updating_decks = decks
         self.render_charts = render_charts
+        self.render_deck_ids = set(render_deck_ids) if render_deck_ids is not None else None
 
     def update(self):
         from projects.models import RepositoryStatus
@@ -27,113 +47,292 @@ class ProjectUpdater:
             self._update()
         except Exception:
             logger.error(f"Could not update repo information for project {self.project.pk}.", exc_info=True)
-            self.project.repository_status = RepositoryStatus.UNKNOWN
-            self.project.save()
+            self._fail(RepositoryStatus.UNKNOWN)
+        finally:
+            bump_project_version(self.project.pk, commit=self.project.current_commit)
+
+    def is_up_to_date(self) -> bool:
+        """Checks whether the branch still points to the commit of the last successful update."""
+        project = self.project
+        if project.spec_type != "helm" or not project.current_commit:
+            return False
+        remote_head = get_remote_head(
+            project.spec_repository,
+            access_username=project.access_username,
+            access_token=project.access_token,
+            branch=project.spec_repository_branch,
+        )
+        return remote_head == project.current_commit
+
+    def _fail(self, status: str):
+        # the current commit is only kept for successful updates, as it is used to skip unchanged repositories
+        self.project.current_commit = ""
+        self.project.current_commit_date_time = None
+        self.project.repository_status = status
+        self.project.save()
+        publish_sync_progress(self.project.pk, status=status, commit=self.project.current_commit)
 
     def _update(self):
         project = self.project
-        if project.spec_type == "helm":
-            parser = HelmRepositoryParser(
-                repository_url=project.spec_repository,
-                access_username=project.access_username,
-                access_token=project.access_token,
-                branch=project.spec_repository_branch,
-            )
-        else:
+        if project.spec_type != "helm":
             logger.warning("Repository Spec Type is currently not supported.")
             return
 
-        try:
-            parser.parse()
-        except RepositoryBranchUnavailable:
-            logger.error(f"Could not update repo information for project {project.pk}.", exc_info=True)
-            project.repository_status = RepositoryStatus.BRANCH_UNAVAILABLE
-            project.save()
-            return
-        except RepositoryAuthenticationFailed:
-            project.repository_status = RepositoryStatus.AUTH_FAILED
-            project.save()
-            return
-        except RepositoryCloningFailed:
-            project.repository_status = RepositoryStatus.CLONING_FAILED
-            project.save()
-            return
-        except Exception:
-            logger.error(f"Could not parse repository for project {project.pk}.", exc_info=True)
-            project.repository_status = RepositoryStatus.PARSING_FAILED
-            project.save()
-            return
+        publish_sync_progress(project.pk, phase=SyncPhase.CLONING)
+        with RepositoryCache().checkout(
+            project.spec_repository, project.access_username, project.access_token
+        ) as repository_path:
+            if repository_path:
+                # the parser clones from the local cache, which is already authenticated and up to date
+                parser = HelmRepositoryParser(
+                    repository_url=repository_path,
+                    access_username="",
+                    access_token="",
+                    branch=project.spec_repository_branch,
+                )
+            else:
+                parser = HelmRepositoryParser(
+                    repository_url=project.spec_repository,
+                    access_username=project.access_username,
+                    access_token=project.access_token,
+                    branch=project.spec_repository_branch,
+                )
+            publish_sync_progress(project.pk, phase=SyncPhase.PARSING)
+            if not self._parse(parser):
+                return
+            for deck_data in parser.deck_data:
+                # without a cached clone the tree hash is unknown and the deck is always rendered
+                deck_data.tree_hash = (
+                    get_tree_hash(repository_path, parser.repository_data.current_commit, deck_data.dir_path)
+                    if repository_path
+                    else None
+                )
 
         project.current_commit = parser.repository_data.current_commit
         project.current_commit_date_time = parser.repository_data.current_commit_date_time
         project.repository_status = RepositoryStatus.CLONING_SUCCESSFUL
         project.save()
+        publish_sync_progress(project.pk, status=project.repository_status, commit=project.current_commit)
         if self.updating_decks:
             # there is a limited deck update requested
-            req_decks = []
-            for available_deck in parser.deck_data:
-                if self.updating_decks.filter(hash=available_deck.hash).exists():
-                    req_decks.append(available_deck)
-            decks_data = self.enrich_decks_data(req_decks)
+            deck_hashes = set(self.updating_decks.values_list("hash", flat=True))
+            decks_data = self.enrich_decks_data([deck for deck in parser.deck_data if deck.hash in deck_hashes])
         else:
-            decks_data = self.enrich_decks_data(parser.deck_data)
-            self.delete_stale_decks(exclude_these=decks_data)
+            decks_data = self.enrich_decks_data(parser.deck_data, delete_stale=True)
 
         if self.render_charts:
-            render_list = [(deck, env) for deck in decks_data for env in deck.environments]
-            updated_decks = parser.render(*render_list)
-            for deck, environment in updated_decks:
-                level = Environment.objects.get(id=environment.id)
-                self._update_deployments(level, environment)
+            # only decks whose chart directory, environments or overrides changed since their last rendering
+            rendering_decks = [
+                deck
+                for deck in decks_data
+                if deck.requires_render and (self.render_deck_ids is None or deck.id in self.render_deck_ids)
+            ]
+            levels = Environment.objects.in_bulk([env.id for deck in rendering_decks for env in deck.environments])
+            failed_decks = []
+            publish_sync_progress(project.pk, phase=SyncPhase.RENDERING, current=0, total=len(rendering_decks))
+            for rendered, (deck, updated_environments) in enumerate(self._render(parser, rendering_decks), 1):
+                publish_sync_progress(
+                    project.pk, phase=SyncPhase.RENDERING, current=rendered, total=len(rendering_decks), deck_id=deck.id
+                )
+                if updated_environments is None:
+                    failed_decks.append(deck.id)
+                    rendered_environments.labels("failure").inc(len(deck.environments))
+                    continue
+                rendered_environments.labels("success").inc(len(updated_environments))
+                rendered_bytes.inc(
+                    sum(len(spec.content) for _, environment in updated_environments for spec in environment.specs_data)
+                )
+                for _, environment in updated_environments:
+                    self._update_deployments(levels[environment.id], environment)
+                    self._update_manifest(levels[environment.id], environment, deck)
+                Deck.objects.filter(id=deck.id).update(tree_hash=deck.tree_hash or "", values_hash=deck.values_hash)
+            if failed_decks:
+                logger.error(f"Could not render decks {failed_decks} of project {project.pk}.")
+                self._fail(RepositoryStatus.UNKNOWN)
+                return
 
-    def enrich_decks_data(self, decks_data: List[DeckData]):
-        from projects.models import Deck
+        project.repository_status = RepositoryStatus.OK
+        project.save()
+        publish_sync_progress(project.pk, status=project.repository_status, commit=project.current_commit)
 
-        for deck_data in decks_data:
-            deck, created = Deck.objects.update_or_create(  # maybe update or create
-                project=self.project,
-                hash=deck_data.hash,
-                defaults={
+    def _render(
+        self, parser: HelmRepositoryParser, decks_data: List[DeckData]
+    ) -> Iterator[Tuple[DeckData, Optional[List[Tuple[DeckData, RenderEnvironment]]]]]:
+        """
+        Renders the decks in a bounded thread pool and yields each deck with its rendered environments on completion.
+
+        Helm runs in subprocesses, so the threads render in parallel. The environments of one deck are rendered one
+        after another, as they share the chart directory. Decks which fail or exceed ``settings.RENDER_TIMEOUT``
+        seconds are yielded with None.
+        """
+        started = {}
+
+        def render(deck):
+            started[deck.id] = time.monotonic()
+            with observe_phase(TimedPhase.RENDER):
+                return parser.render(*[(deck, env) for env in deck.environments])
+
+        executor = ThreadPoolExecutor(max_workers=settings.RENDER_WORKERS)
+        pending = {executor.submit(render, deck): deck for deck in decks_data}
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    deck = pending.pop(future)
+                    try:
+                        yield deck, future.result()
+                    except Exception:
+                        logger.error(f"Could not render deck {deck.id}.", exc_info=True)
+                        yield deck, None
+                now = time.monotonic()
+                for future, deck in list(pending.items()):
+                    if not future.done() and now - started.get(deck.id, now) > settings.RENDER_TIMEOUT:
+                        # the render thread cannot be interrupted, its result is discarded
+                        logger.error(f"Rendering deck {deck.id} timed out.")
+                        del pending[future]
+                        yield deck, None
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _parse(self, parser: HelmRepositoryParser) -> bool:
+        project = self.project
+        try:
+            with observe_phase(TimedPhase.PARSE):
+                parser.parse()
+        except RepositoryBranchUnavailable:
+            logger.error(f"Could not update repo information for project {project.pk}.", exc_info=True)
+            self._fail(RepositoryStatus.BRANCH_UNAVAILABLE)
+            return False
+        except RepositoryAuthenticationFailed:
+            self._fail(RepositoryStatus.AUTH_FAILED)
+            return False
+        except RepositoryCloningFailed:
+            self._fail(RepositoryStatus.CLONING_FAILED)
+            return False
+        except Exception:
+            logger.error(f"Could not parse repository for project {project.pk}.", exc_info=True)
+            self._fail(RepositoryStatus.PARSING_FAILED)
+            return False
+        return True
+
+    @observe_phase(TimedPhase.ENRICH)
+    def enrich_decks_data(self, decks_data: List[DeckData], delete_stale: bool = False):
+        """
+        Reconciles the decks of the project with the parsed decks and attaches their render environments.
+
+        Existing decks, environments and helm overrides are loaded upfront, all changes are written in bulk within one
+        transaction. With ``delete_stale`` decks which are not part of the parsed decks anymore are deleted.
+        """
+        deck_fields = ("title", "description", "dir_path", "type", "file_information")
+        with transaction.atomic():
+            existing_decks = {deck.hash: deck for deck in self.project.decks.all()}
+            decks = {}
+            created_decks = []
+            updated_decks = []
+            for deck_data in decks_data:
+                values = {
                     "title": deck_data.title,
                     "description": deck_data.description,
                     "dir_path": deck_data.dir_path,
                     "type": deck_data.type,
                     "file_information": deck_data.file_information,
-                },
-            )
+                }
+                deck = existing_decks.get(deck_data.hash)
+                if deck is None:
+                    deck = Deck(project=self.project, hash=deck_data.hash, **values)
+                    created_decks.append(deck)
+                elif any(getattr(deck, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(deck, field, value)
+                    updated_decks.append(deck)
+                decks[deck_data.hash] = deck
+            Deck.objects.bulk_create(created_decks)
+            Deck.objects.bulk_update(updated_decks, deck_fields)
 
-            if created:
-                environment = Environment.create_initial_environment(deck)
-                environments = [environment]
-            else:
-                deck.update_environments(deck_data)
-                environments = deck.environments.all()
+            if delete_stale:
+                deck_hashes = {deck_data.hash for deck_data in decks_data}
+                stale_decks = [deck.pk for deck_hash, deck in existing_decks.items() if deck_hash not in deck_hashes]
+                if stale_decks:
+                    logger.info(f"Deleting stale decks for project {self.project.pk}.")
+                    Deck.objects.filter(pk__in=stale_decks).delete()
+
+            environments = defaultdict(list)
+            existing_deck_ids = [deck.pk for deck_hash, deck in decks.items() if deck_hash in existing_decks]
+            for environment in Environment.objects.filter(deck_id__in=existing_deck_ids).select_related(
+                "helm_overrides"
+            ):
+                environments[environment.deck_id].append(environment)
+            updated_environments = []
+            for deck_data in decks_data:
+                deck = decks[deck_data.hash]
+                updated_environments += deck.update_environments(deck_data, environments=environments[deck.pk])
+            Environment.objects.bulk_update(updated_environments, ["values_path", "value_schema"])
+            initial_environments = [Environment.get_initial_environment(deck) for deck in created_decks]
+            Environment.objects.bulk_create(initial_environments)
+            for environment in initial_environments:
+                # new environments have no helm overrides, caching their absence saves a query per environment
+                Environment.helm_overrides.related.set_cached_value(environment, None)
+                environments[environment.deck_id].append(environment)
 
-            for level in environments:
+        for deck_data in decks_data:
+            deck = decks[deck_data.hash]
+            for level in environments[deck.pk]:
                 environment = RenderEnvironment(values_path=level.values_path, specs_data=[])
                 environment.id = level.id
-                try:
-                    if level.helm_overrides.overrides:
-                        environment.update_values_from_yaml(level.helm_overrides.overrides)
-                except ObjectDoesNotExist:
-                    pass
+                overrides = self._get_overrides(level)
+                if overrides:
+                    environment.update_values_from_yaml(overrides)
                 deck_data.environments.append(environment)
 
+            deck_data.id = deck.id
+            deck_data.values_hash = self.get_values_hash(environments[deck.pk])
+            deck_data.requires_render = (
+                not deck_data.tree_hash
+                or deck_data.tree_hash != deck.tree_hash
+                or deck_data.values_hash != deck.values_hash
+            )
+
+        synced_decks.inc(len(decks_data))
         return decks_data
 
-    def delete_stale_decks(self, exclude_these):
-        deck_hashes = [deck.hash for deck in exclude_these]
-        stale_decks = self.project.decks.exclude(hash__in=deck_hashes)
-        if stale_decks:
-            logger.info(f"Deleting stale decks for project {self.project.pk}.")
-            stale_decks.delete()
+    def get_stale_deck_ids(self) -> List:
+        """Returns the IDs of the decks whose environments changed since their last rendering."""
+        environments = defaultdict(list)
+        for environment in Environment.objects.filter(deck__project=self.project).select_related("helm_overrides"):
+            environments[environment.deck_id].append(environment)
+        return [
+            deck.pk
+            for deck in self.project.decks.only("pk", "values_hash")
+            if self.get_values_hash(environments[deck.pk]) != deck.values_hash
+        ]
+
+    @classmethod
+    def get_values_hash(cls, environments: Iterable[Environment]) -> str:
+        """Returns the hash of the render inputs of the environments of a deck, which are kept in the database."""
+        render_inputs = [
+            [str(level.id), level.type, level.values_path, str(level.sops_credentials_id), cls._get_overrides(level)]
+            for level in environments
+        ]
+        return hashlib.sha256(json.dumps(sorted(render_inputs)).encode()).hexdigest()
+
+    @staticmethod
+    def _get_overrides(environment: Environment) -> str:
+        try:
+            return environment.helm_overrides.overrides
+        except ObjectDoesNotExist:
+            return ""
 
+    @observe_phase(TimedPhase.UPDATE_DEPLOYMENTS)
     def _update_deployments(self, environment: Environment, render_env: RenderEnvironment):
-        environment.deployments.all().delete()
         if hasattr(render_env, "values_yaml"):
-            environment.value_schema = create_json_value_schema_from_string(render_env.values_yaml)
-            environment.save()
+            value_schema = value_schema_cache.get_schema(render_env.values_yaml)
+            if value_schema != environment.value_schema:
+                environment.value_schema = value_schema
+                environment.save()
 
+        deployments = {}
         for spec_data in render_env.specs_data:
             if spec_data.kind == "Deployment":
                 content = yaml.load(spec_data.content, Loader=yaml.FullLoader)
@@ -141,10 +340,61 @@ class ProjectUpdater:
                     title = content["metadata"]["name"]
                 except (KeyError, TypeError):
                     title = spec_data.name
-                ports = self._get_ports(content)
-                K8SDeployment.objects.update_or_create(
-                    environment=environment, title=title, is_switchable=False, ports=",".join(ports)
-                )
+                deployments[title] = ",".join(self._get_ports(content))
+
+        # deployments are matched by title, so unchanged deployments keep their rows and ids
+        existing_deployments = {}
+        stale_deployments = []
+        for deployment in environment.deployments.all():
+            if deployment.title in deployments and deployment.title not in existing_deployments:
+                existing_deployments[deployment.title] = deployment
+            else:
+                stale_deployments.append(deployment.pk)
+        updated_deployments = []
+        for title, deployment in existing_deployments.items():
+            if deployment.ports != deployments[title]:
+                deployment.ports = deployments[title]
+                updated_deployments.append(deployment)
+        created_deployments = [
+            K8SDeployment(environment=environment, title=title, is_switchable=False, ports=ports)
+            for title, ports in deployments.items()
+            if title not in existing_deployments
+        ]
+
+        with transaction.atomic():
+            if stale_deployments:
+                K8SDeployment.objects.filter(pk__in=stale_deployments).delete()
+            K8SDeployment.objects.bulk_update(updated_deployments, ["ports"])
+            K8SDeployment.objects.bulk_create(created_deployments)
+
+    def _update_manifest(self, environment: Environment, render_env: RenderEnvironment, deck_data: DeckData):
+        """
+        Stores the rendered manifests of the environment, so that they are served without rendering them again.
+
+        The manifests reference a blob shared by all environments rendering identical manifests, only new manifests
+        are written.
+        """
+        commit = self.project.current_commit
+        version = hashlib.sha256(f"{commit}:{deck_data.values_hash}".encode()).hexdigest()
+        specs = [{"sourceName": spec_data.name, "content": spec_data.content} for spec_data in render_env.specs_data]
+        with transaction.atomic():
+            previous_blob = (
+                EnvironmentManifest.objects.select_for_update()
+                .filter(environment=environment)
+                .values_list("blob_id", flat=True)
+                .first()
+            )
+            EnvironmentManifest.objects.update_or_create(
+                environment=environment,
+                defaults={
+                    "commit": commit,
+                    "values_hash": deck_data.values_hash,
+                    "etag": f'"{version}"',
+                    "blob_id": ManifestBlob.acquire(json.dumps({"specs": specs}).encode()),
+                },
+            )
+            if previous_blob is not None:
+                ManifestBlob.release(previous_blob)
 
     def _get_ports(self, content):
         ports = set()
@@ -157,4 +407,5 @@ class ProjectUpdater:
                         ports.add(str(port["containerPort"]))
         except KeyError:
             pass
-        return list(ports)
+        # sorted to compare the ports with the stored ones
+        return sorted(ports)
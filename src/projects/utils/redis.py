@@ -0,0 +1,17 @@
+from functools import lru_cache
+from typing import Optional
+
+from django.conf import settings
+from redis import Redis
+
+
+@lru_cache(maxsize=None)
+def _get_client(url: str) -> Redis:
+    return Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+
+
+def get_redis() -> Optional[Redis]:
+    """Returns the shared Redis client, or None if ``settings.REDIS_URL`` is not configured."""
+    if not settings.REDIS_URL:
+        return None
+    return _get_client(settings.REDIS_URL)
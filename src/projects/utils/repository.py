@@ -0,0 +1,193 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from urllib.parse import quote, urlsplit, urlunsplit
+
+from django.conf import settings
+from git import Git
+from git.exc import GitCommandError
+
+from projects.utils.metrics import TimedPhase, observe_phase
+
+logger = logging.getLogger("projects.repository")
+
+# seconds until a git command talking to the remote is killed
+REMOTE_TIMEOUT = 30
+
+
+def get_authenticated_url(repository_url: str, access_username: str = "", access_token: str = "") -> str:
+    """Returns the repository URL with the access credentials embedded for HTTPS authentication."""
+    parts = urlsplit(repository_url)
+    if not access_token or not parts.hostname:
+        return repository_url
+    credentials = quote(access_token, safe="")
+    if access_username:
+        credentials = f"{quote(access_username, safe='')}:{credentials}"
+    netloc = f"{credentials}@{parts.hostname}"
+    if parts.port:
+        netloc = f"{netloc}:{parts.port}"
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def get_remote_head(
+    repository_url: str, access_username: str = "", access_token: str = "", branch: str = None
+) -> Optional[str]:
+    """
+    Resolves the commit the given branch (or the default branch) points to without cloning the repository.
+
+    Returns None if the head could not be resolved, e.g. the branch does not exist or the remote is not reachable.
+    """
+    ref = f"refs/heads/{branch}" if branch else "HEAD"
+    git = Git()
+    try:
+        with git.custom_environment(GIT_TERMINAL_PROMPT="0"):
+            output = git.ls_remote(
+                get_authenticated_url(repository_url, access_username, access_token),
+                ref,
+                kill_after_timeout=REMOTE_TIMEOUT,
+            )
+    except GitCommandError as e:
+        # the error message contains the command line and thereby the credentials, hence it is not logged
+        logger.warning(f"Could not resolve remote head of {repository_url} (exit status {e.status}).")
+        return None
+    for line in output.splitlines():
+        commit, _, name = line.partition("\t")
+        if name == ref:
+            return commit
+    return None
+
+
+def get_tree_hash(repository_path: str, commit: str, path: str) -> Optional[str]:
+    """Returns the hash of the git object at the repository relative path in the given commit."""
+    path = path.strip("/")
+    if path.startswith("./"):
+        path = path[2:]
+    revision = f"{commit}:{path}" if path and path != "." else f"{commit}^{{tree}}"
+    try:
+        return Git(repository_path).rev_parse("--verify", "--quiet", revision)
+    except GitCommandError:
+        return None
+
+
+class RepositoryCache:
+    """
+    Bare clones of spec repositories below ``settings.REPOSITORY_ROOT``.
+
+    Every clone is kept up to date with incremental fetches instead of cloning the repository for each update. Clones
+    are keyed by repository URL and credentials, so they are only shared between projects with the same access. The
+    least recently used clones are removed once the cache exceeds ``settings.REPOSITORY_CACHE_MAX_SIZE`` bytes.
+    """
+
+    def __init__(self, root: str = None, max_size: int = None):
+        self.root = root if root is not None else settings.REPOSITORY_ROOT
+        self.max_size = max_size if max_size is not None else settings.REPOSITORY_CACHE_MAX_SIZE
+
+    def get_path(self, repository_url: str, access_username: str = "", access_token: str = "") -> str:
+        key = hashlib.sha256(f"{repository_url}\n{access_username}\n{access_token}".encode()).hexdigest()
+        return os.path.join(self.root, f"{key}.git")
+
+    @contextmanager
+    def checkout(
+        self, repository_url: str, access_username: str = "", access_token: str = ""
+    ) -> Iterator[Optional[str]]:
+        """
+        Brings the cached clone of the repository up to date and yields its path.
+
+        The clone is locked exclusively while it is fetched and shared while it is in use, so that concurrent workers
+        never read a clone which is being updated or evicted. Yields None if the cache is disabled or the repository
+        could not be fetched, the caller is expected to fall back to the remote repository then.
+        """
+        if not self.root:
+            yield None
+            return
+
+        os.makedirs(self.root, exist_ok=True)
+        path = self.get_path(repository_url, access_username, access_token)
+        # lock files are never removed, otherwise two workers could hold a lock on different files
+        with open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                authenticated_url = get_authenticated_url(repository_url, access_username, access_token)
+                self._fetch(path, repository_url, authenticated_url)
+                fetched = True
+            except GitCommandError as e:
+                # the error message contains the credentials, hence it is neither logged nor chained
+                logger.warning(f"Could not update cached clone of {repository_url} (exit status {e.status}).")
+                fetched = False
+            if fetched:
+                try:
+                    # the modification time of the lock file tracks when the clone was used last
+                    os.utime(lock_file.fileno())
+                    fcntl.flock(lock_file, fcntl.LOCK_SH)
+                    yield path
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        if not fetched:
+            # the lock is released, so that other workers do not wait while the caller uses the remote repository
+            yield None
+            return
+        self.evict(keep=path)
+
+    @observe_phase(TimedPhase.CLONE)
+    def _fetch(self, path: str, repository_url: str, authenticated_url: str):
+        if os.path.isdir(path):
+            git = Git(path)
+            with git.custom_environment(GIT_TERMINAL_PROMPT="0"):
+                git.fetch("--prune", authenticated_url, "+refs/heads/*:refs/heads/*")
+            return
+
+        logger.info(f"Creating cached clone of {repository_url}.")
+        # clone next to the final location, so an interrupted clone never shows up as a cache entry
+        temp_path = f"{path}.tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        git = Git(self.root)
+        with git.custom_environment(GIT_TERMINAL_PROMPT="0"):
+            git.clone("--bare", authenticated_url, temp_path)
+        # do not keep the credentials in the repository configuration
+        Git(temp_path).remote("set-url", "origin", repository_url)
+        os.rename(temp_path, path)
+
+    def evict(self, keep: str = None):
+        """Removes the least recently used clones until the cache fits into its maximum size."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.endswith(".git") or not os.path.isdir(path):
+                continue
+            lock_path = f"{path}.lock"
+            last_used = os.path.getmtime(lock_path) if os.path.exists(lock_path) else 0
+            entries.append((last_used, path, _get_size(path)))
+
+        total_size = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            with open(f"{path}.lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # the clone is in use by another worker
+                    continue
+                try:
+                    logger.info(f"Evicting cached clone {path}.")
+                    shutil.rmtree(path, ignore_errors=True)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            total_size -= size
+
+
+def _get_size(path: str) -> int:
+    size = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                size += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
@@ -0,0 +1,67 @@
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from projects.models import Project, RepositoryStatus
+from projects.utils.sync import SyncPriority, get_running_syncs, request_sync
+
+logger = logging.getLogger("projects.schedule")
+
+# statuses of repositories which fail until they are fixed, e.g. by updating the access token
+FAILING_STATUSES = (RepositoryStatus.AUTH_FAILED, RepositoryStatus.BRANCH_UNAVAILABLE, RepositoryStatus.CLONING_FAILED)
+# statuses of syncs which are not finished
+SYNCING_STATUSES = (RepositoryStatus.CLONING_PENDING, RepositoryStatus.CLONING)
+
+
+def get_sync_delay(failures: int = 0) -> timedelta:
+    """Returns the delay of the next scheduled sync, which doubles with every failed sync up to a maximum."""
+    seconds = min(settings.SYNC_INTERVAL * 2 ** failures, settings.SYNC_MAX_BACKOFF)
+    # syncs scheduled at the same time drift apart
+    return timedelta(seconds=seconds * random.uniform(1 - settings.SYNC_JITTER, 1 + settings.SYNC_JITTER))
+
+
+def schedule_syncs(now: datetime = None) -> List[Project]:
+    """
+    Requests the syncs of the projects which are due and returns the projects.
+
+    Projects are scheduled the first time at a random time within ``settings.SYNC_INTERVAL``, so that their syncs are
+    spread across the interval instead of starting all at once. Syncs are requested for at most as many projects as
+    there are free slots of the ``settings.SYNC_CONCURRENCY`` syncs running at a time, projects which are due
+    meanwhile are synced by the next runs. The syncs of projects whose repositories keep failing are backed off
+    exponentially.
+    """
+    now = now or timezone.now()
+    unscheduled = list(Project.objects.filter(next_sync__isnull=True).only("pk"))
+    for project in unscheduled:
+        project.next_sync = now + timedelta(seconds=random.uniform(0, settings.SYNC_INTERVAL))
+    Project.objects.bulk_update(unscheduled, ["next_sync"], batch_size=500)
+
+    limit = settings.SYNC_CONCURRENCY - (get_running_syncs() or 0)
+    if limit <= 0:
+        logger.info("Postponing scheduled syncs, as there is no free sync slot.")
+        return []
+    with transaction.atomic():
+        projects = list(
+            Project.objects.select_for_update(skip_locked=True)
+            .filter(next_sync__lte=now)
+            .only("pk", "repository_status", "sync_failures")
+            .order_by("next_sync")[:limit]
+        )
+        for project in projects:
+            if project.repository_status in FAILING_STATUSES:
+                project.sync_failures += 1
+            elif project.repository_status not in SYNCING_STATUSES:
+                project.sync_failures = 0
+            project.next_sync = now + get_sync_delay(project.sync_failures)
+        Project.objects.bulk_update(projects, ["next_sync", "sync_failures"])
+
+    for project in projects:
+        if project.sync_failures:
+            logger.info(f"Sync of project {project.pk} failed {project.sync_failures} times in a row.")
+        request_sync(project.pk, priority=SyncPriority.BATCH)
+    return projects
@@ -0,0 +1,244 @@
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional
+
+from django.conf import settings
+from redis import RedisError
+from redis.exceptions import LockError
+
+from projects.utils.redis import get_redis
+
+logger = logging.getLogger("projects.sync")
+
+SYNC_KEY_PREFIX = "projects:sync:"
+SLOT_KEY_PREFIX = "projects:sync-slots:"
+# slots of all running syncs
+GLOBAL_SLOT_KEY = f"{SLOT_KEY_PREFIX}all"
+
+# takes one of the limited slots of each set, e.g. of all syncs and of the syncs of an organization, returns the number
+# of the first set without free slot or 0, if the slots were taken. Slots of crashed workers expire.
+ACQUIRE_SLOT = """
+for i, key in ipairs(KEYS) do
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", ARGV[2])
+    if redis.call("ZCARD", key) >= tonumber(ARGV[4 + i]) then
+        return i
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call("ZADD", key, ARGV[3], ARGV[1])
+    redis.call("EXPIRE", key, ARGV[4])
+end
+return 0
+"""
+
+
+class SyncPriority:
+    # syncs requested by users, e.g. by updating a project or its environments
+    INTERACTIVE = "interactive"
+    # scheduled syncs
+    BATCH = "batch"
+
+
+class SyncRequest(NamedTuple):
+    # the decks to update, None updates all decks
+    deck_ids: Optional[List[str]]
+    render: bool
+
+
+class SyncPostponed(Exception):
+    """Raised if a sync cannot start, as the project is synced already or there is no free slot."""
+
+
+def _release_slot(redis, slots: str, slot: str):
+    with redis.pipeline() as pipeline:
+        pipeline.zrem(GLOBAL_SLOT_KEY, slot)
+        pipeline.zrem(slots, slot)
+        pipeline.execute()
+
+
+def get_running_syncs() -> Optional[int]:
+    """Returns the number of running syncs, or None if it is unknown."""
+    redis = get_redis()
+    if redis is None:
+        return None
+    try:
+        with redis.pipeline() as pipeline:
+            pipeline.zremrangebyscore(GLOBAL_SLOT_KEY, "-inf", time.time())
+            pipeline.zcard(GLOBAL_SLOT_KEY)
+            return pipeline.execute()[-1]
+    except RedisError as e:
+        logger.warning(f"Could not count running syncs: {e}")
+        return None
+
+
+def enqueue_sync(project_id, priority: str = SyncPriority.INTERACTIVE, countdown: float = None, **kwargs):
+    """Enqueues the sync task of the project, on the queue of the priority if one is configured."""
+    from projects.tasks import update_repository_information
+
+    queue = settings.SYNC_INTERACTIVE_QUEUE if priority == SyncPriority.INTERACTIVE else settings.SYNC_BATCH_QUEUE
+    update_repository_information.apply_async(
+        (project_id,), dict(kwargs, priority=priority), queue=queue, countdown=countdown
+    )
+
+
+def get_postpone_delay(attempt: int) -> float:
+    """Returns the seconds a postponed sync waits, which double with every attempt up to the sync lock timeout."""
+    seconds = min(settings.SYNC_RETRY_DELAY * 2 ** attempt, settings.SYNC_LOCK_TIMEOUT)
+    # syncs postponed at the same time drift apart
+    return seconds * random.uniform(1, 1 + settings.SYNC_JITTER)
+
+
+def _merge_request(pipeline, key: str, deck_ids: Optional[List], render: bool):
+    if deck_ids:
+        pipeline.sadd(f"{key}:decks", *[str(deck_id) for deck_id in deck_ids])
+    else:
+        pipeline.hset(f"{key}:request", "all", 1)
+    if render:
+        pipeline.hset(f"{key}:request", "render", 1)
+
+
+def request_sync(project_id, deck_ids: List = None, render: bool = False, priority: str = SyncPriority.INTERACTIVE):
+    """
+    Requests a sync of the project with its repository.
+
+    With Redis, requests are coalesced per project: the request is merged into the pending request of the project and
+    a sync task is only enqueued, if none of the priority is queued already. The first queued task performs all
+    requests merged until it starts, while at most one task syncs the project at a time (see ``project_sync``). An
+    interactive request therefore overtakes a queued batch sync, which finds nothing left to do.
+    """
+    redis = get_redis()
+    if redis is None:
+        enqueue_sync(project_id, priority, deck_ids=deck_ids, render=render)
+        return
+
+    key = f"{SYNC_KEY_PREFIX}{project_id}"
+    try:
+        with redis.pipeline() as pipeline:
+            _merge_request(pipeline, key, deck_ids, render)
+            pipeline.set(f"{key}:queued:{priority}", 1, nx=True, ex=settings.SYNC_LOCK_TIMEOUT)
+            queued = pipeline.execute()[-1]
+    except RedisError as e:
+        logger.warning(f"Could not coalesce sync of project {project_id}: {e}")
+        enqueue_sync(project_id, priority, deck_ids=deck_ids, render=render)
+        return
+    if queued:
+        enqueue_sync(project_id, priority, coalesced=True)
+    else:
+        logger.info(f"Sync of project {project_id} is queued already.")
+
+
+def park_sync(project_id, priority: str, request: SyncRequest = None):
+    """
+    Keeps the request pending without a queued sync task of the priority, e.g. of a sync postponed too often.
+
+    The request is performed by the next sync of the project, which the next request enqueues, at the latest the next
+    scheduled sync. Without ``request`` only the task is dropped, as the requests of coalesced tasks are pending
+    already.
+    """
+    redis = get_redis()
+    if redis is None:
+        logger.warning(f"Dropping sync of project {project_id}, as it cannot be kept pending without Redis.")
+        return
+
+    key = f"{SYNC_KEY_PREFIX}{project_id}"
+    try:
+        with redis.pipeline() as pipeline:
+            if request is not None:
+                _merge_request(pipeline, key, request.deck_ids, request.render)
+            pipeline.delete(f"{key}:queued:{priority}")
+            pipeline.execute()
+    except RedisError as e:
+        logger.warning(f"Could not keep sync of project {project_id} pending: {e}")
+
+
+@contextmanager
+def project_sync(
+    project_id,
+    organization,
+    priority: str = SyncPriority.INTERACTIVE,
+    deck_ids: List = None,
+    render: bool = False,
+    coalesced: bool = False,
+) -> Iterator[Optional[SyncRequest]]:
+    """
+    Locks the sync of the project and yields the pending request merged with the given one.
+
+    At most ``settings.SYNC_CONCURRENCY`` syncs run at a time, and every organization may run
+    ``settings.SYNC_ORGANIZATION_CONCURRENCY`` syncs of each priority at a time, so that the syncs of one organization
+    do not starve the syncs of others. Raises ``SyncPostponed`` if there is no free slot or another sync of the project
+    is running. Yields None, if the task was ``coalesced`` by ``request_sync`` and its requests were performed by an
+    earlier sync. Without Redis the given request is yielded as is.
+    """
+    redis = get_redis()
+    if redis is None:
+        yield SyncRequest(deck_ids, render)
+        return
+
+    key = f"{SYNC_KEY_PREFIX}{project_id}"
+    slots = f"{SLOT_KEY_PREFIX}{organization}:{priority}"
+    slot = uuid.uuid4().hex
+    lock = redis.lock(f"{key}:lock", timeout=settings.SYNC_LOCK_TIMEOUT)
+    try:
+        now = time.time()
+        full = redis.register_script(ACQUIRE_SLOT)(
+            keys=[GLOBAL_SLOT_KEY, slots],
+            args=[
+                slot,
+                now,
+                now + settings.SYNC_LOCK_TIMEOUT,
+                settings.SYNC_LOCK_TIMEOUT,
+                settings.SYNC_CONCURRENCY,
+                settings.SYNC_ORGANIZATION_CONCURRENCY,
+            ],
+        )
+        if full == 1:
+            raise SyncPostponed("There is no free sync slot.")
+        if full:
+            raise SyncPostponed(f"Organization {organization} has no free {priority} sync slot.")
+        if not lock.acquire(blocking=False):
+            _release_slot(redis, slots, slot)
+            raise SyncPostponed(f"Project {project_id} is synced already.")
+    except RedisError as e:
+        logger.warning(f"Could not lock sync of project {project_id}: {e}")
+        yield SyncRequest(deck_ids, render)
+        return
+
+    try:
+        try:
+            with redis.pipeline() as pipeline:
+                pipeline.hgetall(f"{key}:request")
+                pipeline.smembers(f"{key}:decks")
+                # later requests enqueue the next sync
+                pipeline.delete(
+                    f"{key}:request",
+                    f"{key}:decks",
+                    f"{key}:queued:{SyncPriority.INTERACTIVE}",
+                    f"{key}:queued:{SyncPriority.BATCH}",
+                )
+                pending, pending_decks, _ = pipeline.execute()
+        except RedisError as e:
+            # the pending request is unknown, hence all decks are synced
+            logger.warning(f"Could not load pending sync request of project {project_id}: {e}")
+            pending, pending_decks = {b"all": b"1", b"render": b"1"}, set()
+
+        if pending or pending_decks:
+            render = render or b"render" in pending
+            if b"all" in pending or not (deck_ids or pending_decks):
+                # requested decks are rendered, even if their request is absorbed by a sync of all decks
+                render = render or bool(deck_ids or pending_decks)
+                deck_ids = None
+            else:
+                deck_ids = sorted({str(deck_id) for deck_id in deck_ids or []} | {d.decode() for d in pending_decks})
+        elif coalesced:
+            yield None
+            return
+        yield SyncRequest(deck_ids, render)
+    finally:
+        try:
+            _release_slot(redis, slots, slot)
+            lock.release()
+        except (LockError, RedisError) as e:
+            logger.warning(f"Could not release sync lock of project {project_id}: {e}")
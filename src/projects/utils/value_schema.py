@@ -1,12 +1,36 @@
+import hashlib
 import logging
-from typing import Any, List, Optional
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Optional
 
 import yaml
+from django.conf import settings
 from kombu.utils import json
-from pydantic import BaseModel, Field, create_model
+from redis import RedisError
+
+from projects.utils.metrics import TimedPhase, observe_phase
+from projects.utils.redis import get_redis
 
 logger = logging.getLogger("projects.schema_generation")
 
+# the libyaml based loader is much faster, but only available if PyYAML was built against libyaml
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# JSON schema of scalar values by their exact python type
+TYPE_SCHEMAS = {
+    bool: {"type": "boolean"},
+    int: {"type": "integer"},
+    float: {"type": "number"},
+    str: {"type": "string"},
+    bytes: {"type": "string", "format": "binary"},
+    date: {"type": "string", "format": "date"},
+    datetime: {"type": "string", "format": "date-time"},
+}
+
 
 def create_json_value_schema_from_file(yaml_file_path):
     with open(yaml_file_path, "r") as f:
@@ -18,7 +42,7 @@ def create_json_value_schema_from_string(input: str):
 
 
 def create_json_value_schema(input):
-    content = yaml.safe_load(input)
+    content = yaml.load(input, Loader=SafeLoader)
     if not isinstance(content, dict):
         logger.info("Not parsable.")
         return
@@ -26,53 +50,151 @@ def create_json_value_schema(input):
     return json.dumps(create_schema(content))
 
 
-def create_pydantic_schema(yaml_dict: dict, model_names: List) -> (dict, List):
-    fields = {}
+def create_properties(yaml_dict: dict, definitions: dict, model_names: Dict[str, int]) -> dict:
+    """
+    Walks the values and returns the JSON schema properties for them.
+
+    Every nested dict becomes an object in ``definitions``, which is referenced from its property. The definitions of
+    nested dicts are added before the definition of their parent.
+    """
+    properties = {}
     for key, value in yaml_dict.items():
+        key = str(key)
         type_ = type(value)
-        field_name = key
-        field_kwargs = {}
-        if field_name == "schema":
-            field_name = "schemaAlias"
-            field_kwargs["alias"] = "schema"
+        if key == "schema" and type_ in (dict, list):
+            # objects and lists named "schema" were renamed for the pydantic models the schemas were generated with
+            key = "schemaAlias"
         if type_ is dict:
-            sub_fields, model_names = create_pydantic_schema(value, model_names)
-            name = get_model_name(field_name, model_names)
-            model = create_model(name, **sub_fields)
-            fields[field_name] = (Optional[model], None)
-            model_names.append(name)
-        elif type_ is list:
-            if len(value):
-                fields[field_name] = (Optional[List[type(value[0])]], None)
-            else:
-                fields[field_name] = (Optional[List[Any]], None)
-        elif type_ == type(None):  # noqa
-            fields[field_name] = (
-                Optional[Any],
-                Field(None, **field_kwargs),
-            )
+            sub_properties = create_properties(value, definitions, model_names)
+            name = get_model_name(key, model_names)
+            # definition names are restricted to characters which do not need escaping in references
+            reference = re.sub(r"[^a-zA-Z0-9.\-_]", "_", name)
+            definitions[reference] = {"title": name, "type": "object", "properties": sub_properties}
+            properties[key] = {"$ref": f"#/definitions/{reference}"}
+            continue
+
+        schema = {"title": key.replace("_", " ").title()}
+        if type_ is list:
+            schema["type"] = "array"
+            schema["items"] = get_item_schema(value[0]) if value else {}
+        elif type_ is set:
+            schema.update({"type": "array", "items": {}, "uniqueItems": True})
         else:
-            fields[field_name] = (
-                Optional[type_],
-                Field(None, **field_kwargs),
-            )
-    return fields, model_names
-
-
-def get_model_name(key: str, model_names: List) -> str:
-    """Generates a name for a pydantic model, based on already taken model names."""
+            # values of unknown type (e.g. null) are not restricted
+            schema.update(TYPE_SCHEMAS.get(type_, {}))
+        properties[key] = schema
+    return properties
+
+
+def get_item_schema(item) -> dict:
+    """Returns the JSON schema for the items of a list, which is derived from its first item."""
+    type_ = type(item)
+    if type_ is dict:
+        return {"type": "object"}
+    if type_ is list:
+        return {"type": "array", "items": {}}
+    if type_ is set:
+        return {"type": "array", "items": {}, "uniqueItems": True}
+    if item is None:
+        return {"type": "null"}
+    return dict(TYPE_SCHEMAS.get(type_, {}))
+
+
+def get_model_name(key: str, model_names: Dict[str, int]) -> str:
+    """
+    Generates a name for a definition, based on already taken definition names.
+
+    ``model_names`` maps every taken name to the next suffix to try for it, so that values with many equally named
+    objects do not probe all taken suffixes again for each of them.
+    """
     if key not in model_names:
+        model_names[key] = 1
         return key
-    counter = 1
+    counter = model_names[key]
     while key + str(counter) in model_names:
         counter += 1
+    model_names[key] = counter + 1
+    model_names[key + str(counter)] = 1
     return key + str(counter)
 
 
-def create_schema_json(yaml_dict):
-    values_schema = create_model("HelmValuesJsonSchema", __base__=BaseModel, **create_pydantic_schema(yaml_dict, [])[0])
-    return values_schema.schema()
+def create_schema_json(yaml_dict: dict) -> dict:
+    definitions = {}
+    values_schema = {
+        "title": "HelmValuesJsonSchema",
+        "type": "object",
+        "properties": create_properties(yaml_dict, definitions, {}),
+    }
+    if definitions:
+        values_schema["definitions"] = definitions
+    return values_schema
 
 
 def create_schema(content: dict) -> dict:
     return {"uri": "https://unikube/helm_json_schema", "fileMatch": ["*"], "schema": create_schema_json(content)}
+
+
+class ValueSchemaCache:
+    """
+    Value schemas keyed by the SHA-256 digest of the values YAML they were generated from.
+
+    Identical values files share one schema, regardless of the environment or project they belong to. The most
+    recently used ``settings.VALUE_SCHEMA_CACHE_SIZE`` schemas are kept in process. If ``settings.REDIS_URL`` is
+    configured, schemas are persisted in Redis for ``settings.VALUE_SCHEMA_CACHE_TIMEOUT`` seconds as well, so that
+    they survive restarts and are shared between workers.
+    """
+
+    key_prefix = "projects:value-schema:"
+
+    def __init__(self):
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_schema(self, values_yaml: str) -> Optional[str]:
+        digest = hashlib.sha256(values_yaml.encode()).hexdigest()
+        with self._lock:
+            if digest in self._schemas:
+                self._schemas.move_to_end(digest)
+                return self._schemas[digest]
+
+        data = self._load(digest)
+        if data is None:
+            with observe_phase(TimedPhase.VALUE_SCHEMA):
+                schema = create_json_value_schema_from_string(values_yaml)
+            self._store(digest, schema)
+        else:
+            # an empty value marks values which are not parsable
+            schema = zlib.decompress(data).decode() if data else None
+
+        with self._lock:
+            self._schemas[digest] = schema
+            while len(self._schemas) > settings.VALUE_SCHEMA_CACHE_SIZE:
+                self._schemas.popitem(last=False)
+        return schema
+
+    def clear(self):
+        with self._lock:
+            self._schemas.clear()
+
+    def _load(self, digest: str) -> Optional[bytes]:
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            return redis.get(self.key_prefix + digest)
+        except RedisError as e:
+            logger.warning(f"Could not load value schema from Redis: {e}")
+            return None
+
+    def _store(self, digest: str, schema: Optional[str]):
+        redis = get_redis()
+        if redis is None:
+            return
+        data = zlib.compress(schema.encode()) if schema is not None else b""
+        try:
+            redis.set(self.key_prefix + digest, data, ex=settings.VALUE_SCHEMA_CACHE_TIMEOUT)
+        except RedisError as e:
+            logger.warning(f"Could not store value schema in Redis: {e}")
+
+
+value_schema_cache = ValueSchemaCache()
@@ -0,0 +1,52 @@
+import logging
+from typing import Iterable, List, Optional
+
+from django.db import transaction
+from redis import RedisError
+
+from projects.utils.redis import get_redis
+
+logger = logging.getLogger("projects.versions")
+
+VERSION_KEY_PREFIX = "projects:version:"
+
+
+def bump_project_version(project_id, commit: str = None):
+    """
+    Marks the data of the project as changed, which invalidates all cached responses that include the project.
+
+    The version consists of the current commit of the project and a counter of changes. The version is bumped once the
+    current transaction is committed, so that no response is cached for the new version before the change is visible.
+    """
+    redis = get_redis()
+    if redis is None:
+        return
+
+    def bump():
+        key = f"{VERSION_KEY_PREFIX}{project_id}"
+        try:
+            with redis.pipeline() as pipeline:
+                if commit is not None:
+                    pipeline.hset(key, "commit", commit)
+                pipeline.hincrby(key, "changes", 1)
+                pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Could not bump version of project {project_id}: {e}")
+
+    transaction.on_commit(bump)
+
+
+def get_project_versions(project_ids: Iterable) -> Optional[List[str]]:
+    """Returns the versions of the projects, or None if they are not available."""
+    redis = get_redis()
+    if redis is None:
+        return None
+    try:
+        with redis.pipeline(transaction=False) as pipeline:
+            for project_id in project_ids:
+                pipeline.hmget(f"{VERSION_KEY_PREFIX}{project_id}", "commit", "changes")
+            versions = pipeline.execute()
+    except RedisError as e:
+        logger.warning(f"Could not load project versions: {e}")
+        return None
+    return [f"{(commit or b'').decode()}:{int(changes or 0)}" for commit, changes in versions]
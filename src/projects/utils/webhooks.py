@@ -0,0 +1,133 @@
+import hashlib
+import hmac
+import logging
+import posixpath
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from django.conf import settings
+from django.db.models import Q
+
+from projects.models import Project
+from projects.utils.sync import SyncPriority
+
+logger = logging.getLogger("projects.webhooks")
+
+# "https://user@github.com/org/repo.git", "git@github.com:org/repo.git" and "ssh://git@github.com/org/repo" are all
+# "github.com/org/repo"
+REPOSITORY_URL = re.compile(r"^(?:[a-z+]+://)?(?:[^@/]+@)?(?P<host>[^:/]+)(?::\d+)?[:/](?P<path>.+?)(?:\.git)?/*$")
+
+
+class PushEvent(NamedTuple):
+    # the URLs of the pushed repository
+    repository_urls: List[str]
+    branch: str
+    default_branch: Optional[str]
+    # the changed paths, None if they are not known completely
+    paths: Optional[Set[str]]
+
+
+def normalize_repository_url(url: str) -> Optional[str]:
+    match = REPOSITORY_URL.match(url.strip())
+    if not match:
+        return None
+    return f"{match.group('host').lower()}/{match.group('path').strip('/').lower()}"
+
+
+def verify_signature(headers, body: bytes) -> bool:
+    """Verifies the signature of GitHub or the token of GitLab webhooks with the repository webhook secret."""
+    secret = settings.REPOSITORY_WEBHOOK_SECRET
+    if not secret:
+        return False
+    if "X-Hub-Signature-256" in headers:
+        signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature, headers["X-Hub-Signature-256"])
+    if "X-Gitlab-Token" in headers:
+        return hmac.compare_digest(secret, headers["X-Gitlab-Token"])
+    return False
+
+
+def _get_paths(commits: List[Dict]) -> Set[str]:
+    return {path for commit in commits for key in ("added", "removed", "modified") for path in commit.get(key) or []}
+
+
+def parse_push_event(headers, payload: Dict) -> Optional[PushEvent]:
+    """Returns the push event of a GitHub or GitLab push payload, or None if no branch was pushed."""
+    ref = payload.get("ref") or ""
+    if not ref.startswith("refs/heads/") or set(payload.get("after") or "") == {"0"} or payload.get("deleted"):
+        # tags and deleted branches
+        return None
+    branch = ref[len("refs/heads/") :]
+    commits = payload.get("commits") or []
+
+    if headers.get("X-Gitlab-Event") == "Push Hook":
+        project = payload.get("project") or {}
+        urls = [project.get(key) for key in ("git_http_url", "git_ssh_url", "web_url")]
+        default_branch = project.get("default_branch")
+        # GitLab includes the changed paths of the latest 20 commits only
+        complete = bool(commits) and payload.get("total_commits_count", len(commits)) <= len(commits)
+    elif headers.get("X-GitHub-Event") == "push":
+        repository = payload.get("repository") or {}
+        urls = [repository.get(key) for key in ("clone_url", "html_url", "ssh_url", "git_url")]
+        default_branch = repository.get("default_branch")
+        # forced pushes may replace commits which are not included
+        complete = bool(commits) and not payload.get("forced")
+    else:
+        return None
+    return PushEvent([url for url in urls if url], branch, default_branch, _get_paths(commits) if complete else None)
+
+
+def get_affected_deck_ids(dir_paths: Dict, paths: Iterable[str]) -> Optional[List]:
+    """
+    Returns the IDs of the decks whose directory contains any of the paths.
+
+    Returns None, if a path is not part of any deck, as it may belong to a new deck or be used by several decks.
+    """
+    # the directory of decks in the root of the repository is "."
+    dir_paths = {deck_id: posixpath.normpath(dir_path or ".").strip("/") for deck_id, dir_path in dir_paths.items()}
+    affected = set()
+    for path in paths:
+        deck_ids = [
+            deck_id
+            for deck_id, dir_path in dir_paths.items()
+            if dir_path == "." or path == dir_path or path.startswith(f"{dir_path}/")
+        ]
+        if not deck_ids:
+            return None
+        affected.update(deck_ids)
+    return sorted(affected)
+
+
+def handle_push_event(event: PushEvent) -> List[Project]:
+    """Requests syncs of the projects tracking the pushed branch, of their affected decks only if possible."""
+    urls = {normalize_repository_url(url) for url in event.repository_urls} - {None}
+    if not urls:
+        return []
+    branches = Q(spec_repository_branch=event.branch)
+    if event.branch == event.default_branch:
+        # projects without branch track the default branch
+        branches |= Q(spec_repository_branch__isnull=True) | Q(spec_repository_branch="")
+    # the URLs are compared normalized, candidates are selected by the path of the repository
+    candidates = Q()
+    for url in urls:
+        candidates |= Q(spec_repository__icontains=url.split("/", 1)[1])
+    projects = [
+        project
+        for project in Project.objects.filter(branches, candidates)
+        if normalize_repository_url(project.spec_repository) in urls
+    ]
+
+    synced = []
+    for project in projects:
+        deck_ids = None
+        if event.paths is not None:
+            deck_ids = get_affected_deck_ids(dict(project.decks.values_list("pk", "dir_path")), event.paths)
+            if deck_ids == []:
+                continue
+        logger.info(f"Push to {event.branch} requests sync of project {project.pk} for decks {deck_ids or 'all'}.")
+        if deck_ids:
+            project.update_repository(project.decks.filter(pk__in=deck_ids), render=True, priority=SyncPriority.BATCH)
+        else:
+            project.update_repository(render=True, priority=SyncPriority.BATCH)
+        synced.append(project)
+    return synced
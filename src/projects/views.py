@@ -1,25 +1,154 @@
+import hmac
+import json
 import logging
+import re
+import zlib
 
 from django import views
-from django.http import Http404, HttpResponse, JsonResponse
+from django.conf import settings
+from django.db.models.functions import Length, Substr
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from projects.models import Environment
+from gql.schema.permissions import get_request_permissions
+from projects.models import EnvironmentManifest, ManifestBlob, Project
+from projects.utils.metrics import get_registry
+from projects.utils.progress import SyncProgress, read_sync_progress
+from projects.utils.webhooks import handle_push_event, parse_push_event, verify_signature
 
 logger = logging.getLogger("unikube.views")
 
 
 class K8sSpecsView(views.View):
+    """
+    Serves the manifests of an environment as rendered by the last update of its project.
+
+    The manifests are streamed in chunks read from their stored, gzip-compressed rendering, so that large manifests are
+    never loaded into memory at once, and decompressed on the fly only for clients which do not accept gzip. The ETag
+    changes with the commit and the values the manifests were rendered from, so clients revalidating with
+    ``If-None-Match`` get a 304 response while the manifests are unchanged.
+    """
+
+    chunk_size = 64 * 1024
+
     def get(self, request, environment_uuid):
-        environment = get_object_or_404(Environment, pk=environment_uuid)
-        if environment.application not in request.user.get_applications():
+        manifest = get_object_or_404(
+            EnvironmentManifest.objects.select_related("environment__deck"),
+            environment_id=environment_uuid,
+        )
+        project_id = str(manifest.environment.deck.project_id)
+        if project_id not in get_request_permissions(request).get_resource_ids("project:*"):
+            return HttpResponse(status=403)
+
+        gzipped = bool(re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")))
+        # strong ETags differ between the compressed and the decompressed representation
+        etag = manifest.etag if gzipped else f'{manifest.etag[:-1]}-identity"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            # the blob is gone, if the manifests were replaced meanwhile
+            size = get_object_or_404(ManifestBlob.objects.annotate(size=Length("data")), pk=manifest.blob_id).size
+            chunks = self.get_chunks(manifest.blob_id, size)
+            if not gzipped:
+                chunks = self.decompress(chunks)
+            response = StreamingHttpResponse(chunks, content_type="application/json")
+            if gzipped:
+                response["Content-Encoding"] = "gzip"
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    def get_chunks(self, digest, size):
+        blobs = ManifestBlob.objects.filter(pk=digest)
+        for start in range(0, size, self.chunk_size):
+            # substrings of binary data are 1-indexed like those of text
+            chunk = blobs.annotate(chunk=Substr("data", start + 1, self.chunk_size)).values_list("chunk", flat=True)
+            chunk = chunk.first()
+            if chunk is None:
+                # blobs are immutable, but deleted with their last reference while streaming
+                logger.warning(f"Manifest blob {digest} was deleted while streaming.")
+                return
+            yield bytes(chunk)
+
+    @staticmethod
+    def decompress(chunks):
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+
+
+class SyncProgressView(views.View):
+    """
+    Returns the progress of the syncs of a project, a cheaper replacement for querying its repository status with
+    GraphQL.
+
+    This is a polling endpoint, not a push channel: clients poll it again with the cursor of the previous response as
+    ``after`` and receive the following events. Without ``after`` the latest event is returned. Responses never wait
+    for events, as a waiting request would occupy the request thread of the process. Events are repository status
+    transitions or the progress of the cloning, parsing and rendering phases. Every response includes the current
+    status of the project, which is kept along with the events and only loaded from the database if it is unknown, and
+    its cursor is null if events are not available.
+    """
+
+    cursor_pattern = re.compile(r"^\d+-\d+$")
+
+    def get(self, request, project_uuid):
+        if str(project_uuid) not in get_request_permissions(request).get_resource_ids("project:*"):
+            return HttpResponse(status=403)
+        cursor = request.GET.get("after")
+        if cursor is not None and not self.cursor_pattern.match(cursor):
+            return HttpResponse(status=400)
+
+        progress = read_sync_progress(project_uuid, cursor) or SyncProgress([], None, None, None)
+        status, commit = progress.status, progress.commit
+        if status is None or commit is None:
+            project = get_object_or_404(Project.objects.only("repository_status", "current_commit"), pk=project_uuid)
+            status, commit = project.repository_status, project.current_commit
+        return JsonResponse(
+            {"repositoryStatus": status, "currentCommit": commit, "events": progress.events, "cursor": progress.cursor}
+        )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class RepositoryWebhookView(views.View):
+    """
+    Receives the push webhooks of GitHub and GitLab repositories.
+
+    A push requests a sync of the projects tracking the pushed branch of the repository. If the payload lists all
+    changed paths, only the decks whose directories contain them are synced and projects without affected decks are
+    skipped. Webhook syncs are batch syncs and do not delay the syncs requested by users.
+    """
+
+    def post(self, request):
+        if not verify_signature(request.headers, request.body):
+            return HttpResponse(status=403)
+        if request.headers.get("X-GitHub-Event") == "ping":
+            return JsonResponse({"projects": []})
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return HttpResponse(status=400)
+        event = parse_push_event(request.headers, payload)
+        projects = handle_push_event(event) if event else []
+        return JsonResponse({"projects": [str(project.pk) for project in projects]}, status=202)
+
+
+class MetricsView(views.View):
+    """
+    Exposes the Prometheus metrics of the process, or of all processes sharing ``PROMETHEUS_MULTIPROC_DIR``.
+
+    The endpoint is served along with the public API, hence scrapers must authenticate with ``settings.METRICS_TOKEN``
+    as bearer token.
+    """
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        authorization = request.headers.get("Authorization", "")
+        if not token or not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
             return HttpResponse(status=403)
-        # this user has access to the environment
-        # todo handle other project types
-        if environment.application.project.spec_type == "helm":
-            # specfiles = HelmHandler().get_all_spec_files(environment)
-            specfiles = []
-
-            return JsonResponse({"specs": [{"sourceName": k.sourceName, "content": k.content} for k in specfiles]})
-        else:
-            raise Http404
+        return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)